@@ -1,27 +1,34 @@
 import asyncio
 import csv
-import io
 import logging
 import os
 import re
-import smtplib
+import time
 from datetime import datetime
-from email.header import Header
-from email.mime.text import MIMEText
 import aiofiles
 import aiohttp
 import openai
-import whisper
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot, Dispatcher, F, types
 from aiogram.dispatcher.router import Router
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.filters.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from dotenv import load_dotenv
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from google_maps import google_search_and_extract
-from trustpilot import trustpilot_search
+from csv_export import CsvResultWriter
+from email_sender import close_pools, send_message
+from entity_resolution import resolve_leads
+from google_maps import gmaps, google_search_and_extract
+from http_client import close_session, get_session, log_pool_stats
+from lead_store import get_lead_store
+from leads import Lead
+from llm_client import chat_completion
+from places_cache import get_places_cache
+from search import iter_search_results
+from send_queue import get_send_queue, make_campaign_id, run_campaign
+from sheets_exporter import SheetsExporter, drive_service, sheets_service
+from sqlite_store import close_stores
+from transcription import transcription_service
+from trustpilot import shutdown_parse_pool, trustpilot_search
 
 
 class EmailStates(StatesGroup):
@@ -38,6 +45,10 @@ class EmailStates(StatesGroup):
     awaiting_csv_upload = State()
 
 
+class ResumeStates(StatesGroup):
+    awaiting_password = State()
+
+
 class AnswerStates(StatesGroup):
     answer_text = State()
     answer_draft = State()
@@ -55,17 +66,8 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Настройки для Google Sheets
-SERVICE_ACCOUNT_FILE = os.environ.get("SERVICE_ACCOUNT_FILE")
-SCOPES = [
-    'https://www.googleapis.com/auth/spreadsheets',
-    'https://www.googleapis.com/auth/drive',
-    'https://www.googleapis.com/auth/drive.file'
-]
-credentials = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-sheets_service = build('sheets', 'v4', credentials=credentials)
-drive_service = build('drive', 'v3', credentials=credentials)
+# Google Sheets export: rows of every search are appended to one reused workbook
+sheets_exporter = SheetsExporter(Lead.HEADER)
 
 # Bot token obtained from BotFather in Telegram.
 TOKEN = os.environ.get("TELEGRAM_TOKEN")
@@ -76,20 +78,24 @@ router_search = Router()
 router_answer = Router()
 router_linkedin = Router()
 
-# Load Whisper model
-model = whisper.load_model("tiny")
+# Seconds between "still searching" messages while a /search is running
+SEARCH_PROGRESS_INTERVAL = float(os.environ.get("SEARCH_PROGRESS_INTERVAL", 60))
 
 # Set your OpenAI API key here
 openai.api_key = os.environ.get("OPENAI_API_KEY")
 
 
+@router_search.message(F.voice)
 async def handle_voice(message: types.Message):
     file_info = await bot.get_file(message.voice.file_id)
-    file_path = await bot.download_file(file_info.file_path)
-    with open("voice_message.ogg", "wb") as f:
-        f.write(file_path.read())
-    result = model.transcribe("voice_message.ogg")
-    text = result['text']
+    # Audio stays in memory, so concurrent voice messages can't overwrite each other
+    audio = await bot.download_file(file_info.file_path)
+    try:
+        text = await transcription_service.transcribe(audio.read(), message.voice.duration)
+    except Exception as e:
+        logger.error(f"Error transcribing voice message: {str(e)}")
+        await message.answer("Sorry, I couldn't recognise that voice message.")
+        return
     logger.info(f"Transcribed text from voice: {text}")
     await handle_text_query(message, text)
 
@@ -97,47 +103,76 @@ async def handle_voice(message: types.Message):
 # Define a message handler for the "/start" command.
 @router.message(Command("start"))
 async def start_message(message: types.Message):
-    await message.answer("Hello! Use /search your query by text and after search use /send_email to start sending ")
+    await message.answer("Hello! Use /search your query by text and after search use /send_email to start sending. "
+                         "Use /resume to continue a campaign that was interrupted.")
 
 
 @router_search.message(Command("search"))
-async def handle_text_query(message: types.Message):
-    user_input = message.text
+async def handle_text_query(message: types.Message, text=None):
+    user_input = text or message.text
     queries = await generate_search_queries(user_input)
-    all_results = []
+    sources = []
 
     for query in queries:
         clean_query = re.sub(r'^\d+\.\s*"', '', query).strip('"')
         if clean_query:
-            logging.info(f"Processing query for google maps: {clean_query}")
-            results = await google_search_and_extract(clean_query)
-            for result in results:
-                all_results.append(('Google Maps', result))
-            logging.info(f"Results found for {clean_query}: {len(results)}")
-
-    trustpilot_info = await trustpilot_search(user_input)
-    for info in trustpilot_info:
-        all_results.append(('TrustPilot', info))
-
-    if not all_results:
-        logging.info("No results found.")
-        await message.answer("No results found.")
-        return
-
-    logging.info(f"Total results found: {len(all_results)}")
+            sources.append(('Google Maps', clean_query, google_search_and_extract))
+    sources.append(('TrustPilot', user_input, trustpilot_search))
 
-    csv_data = await create_csv(all_results)
-    await send_csv_to_telegram(message.chat.id, csv_data)
-    logging.info("CSV file sent to Telegram")
+    # All sources run at once; a failed or timed-out source only drops its own results.
+    # The user gets a progress update as each source finishes.
+    all_results = []
+    csv_export = CsvResultWriter()
+    try:
+        heartbeat = asyncio.create_task(send_search_heartbeat(message, all_results))
+        try:
+            async for source, results in iter_search_results(sources):
+                all_results.extend(results)
+                if results:
+                    await message.answer(f"{source}: found {len(results)} companies, {len(all_results)} so far...")
+        finally:
+            heartbeat.cancel()
+
+        if not all_results:
+            logging.info("No results found.")
+            await message.answer("No results found.")
+            return
+
+        logging.info(f"Total results found: {len(all_results)}")
+        log_pool_stats()
+        get_places_cache().log_stats()
+
+        # The same company found by several queries or sources becomes one row, so rows are only
+        # written once every source has finished and all its leads are held until then
+        found = all_results
+        all_results = await asyncio.to_thread(resolve_leads, found)
+        csv_export.write_leads(all_results)
+
+        if await send_csv_to_telegram(message.chat.id, csv_export):
+            logging.info("CSV file sent to Telegram")
+            await remember_delivered_leads(found)
+    finally:
+        csv_export.close()
 
     # Запись данных в Google Sheets
-    spreadsheet_id = await create_google_sheet(all_results)
+    spreadsheet_id = await create_google_sheet(all_results, message.chat.id)
     logging.info(f"Data written to Google Sheets. Spreadsheet ID: {spreadsheet_id}")
 
 
+async def remember_delivered_leads(leads):
+    # Only leads that reached the user count as seen; served-from-store ones keep their original date,
+    # so they are scraped again once LEAD_REVISIT_AFTER has passed
+    by_source = {}
+    for lead in leads:
+        if not lead.stored:
+            by_source.setdefault(lead.sources[0], []).append(lead)
+    for source, source_leads in by_source.items():
+        await get_lead_store().upsert(source, source_leads)
+
+
 async def generate_search_queries(user_input):
     try:
-        response = openai.ChatCompletion.create(
+        full_text = await chat_completion(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "Generate three diverse search queries for local business information based on the user's input."},
@@ -145,8 +180,8 @@ async def generate_search_queries(user_input):
             ],
             max_tokens=150
         )
-        if 'choices' in response and response['choices']:
-            full_text = response['choices'][0]['message']['content'].strip()
+        if full_text:
+            full_text = full_text.strip()
             queries = full_text.split("\n")  # Splitting by newline to separate the queries
             queries = [query.strip().strip('"') for query in queries if query]  # Clean up each query
             if len(queries) < 2:
@@ -162,114 +197,39 @@ async def generate_search_queries(user_input):
 
 
 
-async def create_csv(data):
-    logging.info("Creating CSV file")
-    output = io.StringIO(newline='')
-    writer = csv.writer(output, quoting=csv.QUOTE_ALL)
-    writer.writerow(['Company Name', 'Website', 'Emails/Contact Info', 'Phone', 'Location', 'Rating', 'Reviews', 'Verification'])
+async def send_search_heartbeat(message, all_results):
+    # Long crawls (mostly TrustPilot) otherwise leave the chat silent for minutes
+    while True:
+        await asyncio.sleep(SEARCH_PROGRESS_INTERVAL)
+        await message.answer(f"Still searching... {len(all_results)} companies found so far.")
 
-    for source, item in data:
-        try:
-            if source == 'TrustPilot' and isinstance(item, tuple):  # TrustPilot results
-                name, rating, emails, phone, location, verify, website, reviews = item + ('N/A',) * (8 - len(item))
-                writer.writerow([name, website, emails, phone, location, rating, reviews, verify])
-            elif source == 'Google Maps' and isinstance(item, tuple):  # Google Maps results
-                name, website, emails, phone, address, reviews_count = item + ('N/A',) * (6 - len(item))
-                emails_str = ', '.join(emails) if isinstance(emails, list) else str(emails)
-                writer.writerow([name, website, emails_str, phone, address, 'N/A', reviews_count, 'N/A'])
-            else:
-                logging.warning(f"Unexpected data format or source: {source}, {item}")
-                row_data = list(item) if isinstance(item, tuple) else [str(item)]
-                row_data = row_data + ['N/A'] * (8 - len(row_data))
-                writer.writerow(row_data[:8])
-        except Exception as e:
-            logging.error(f"Error processing item: {source}, {item}. Error: {str(e)}")
-            row_data = [str(item)] + ['N/A'] * 7
-            writer.writerow(row_data[:8])
-
-    output.seek(0)
-    return output
-
-
-async def send_csv_to_telegram(chat_id, csv_data):
-    # Преобразуем StringIO в байты с явной UTF-8 кодировкой
-    byte_data = csv_data.getvalue().encode('utf-8')
 
+async def send_csv_to_telegram(chat_id, csv_export):
+    # The spooled file is streamed into the upload, no second in-memory copy is made
     form_data = aiohttp.FormData()
     form_data.add_field('document',
-                        byte_data,
+                        csv_export.open_for_upload(),
                         filename='companies_results.csv',
                         content_type='text/csv')
 
     logging.info("Sending CSV file to Telegram")
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(f'https://api.telegram.org/bot{TOKEN}/sendDocument?chat_id={chat_id}',
-                                    data=form_data) as resp:
-                if resp.status != 200:
-                    error_text = await resp.text()
-                    logging.error(f"Failed to send CSV. Status: {resp.status}, Response: {error_text}")
-                else:
-                    logging.info("CSV file sent successfully to Telegram")
-        except Exception as e:
-            logging.error(f"Error sending CSV file to Telegram: {str(e)}")
-
-
-async def create_google_sheet(data):
-    # Create a new table
-    spreadsheet = {
-        'properties': {
-            'title': f'Search Results {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}'
-        }
-    }
-    spreadsheet = sheets_service.spreadsheets().create(body=spreadsheet, fields='spreadsheetId').execute()
-    spreadsheet_id = spreadsheet.get('spreadsheetId')
-    logging.info(f'New Spreadsheet created. ID: {spreadsheet_id}')
-
-    # Create a new sheet
-    sheet_title = f'Results {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}'
-    requests = [{
-        "addSheet": {
-            "properties": {
-                "title": sheet_title
-            }
-        }
-    }]
-    body = {'requests': requests}
-    response = sheets_service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body=body).execute()
-    logging.info(f"Added new sheet: {sheet_title}")
-
-    # Write data
-    values = [['Company Name', 'Website/Rating', 'Emails/Contact Info', 'Phone', 'Location', 'Verification']]
-    for item in data:
-        if isinstance(item, tuple):
-            if len(item) >= 3:  # Google Maps results
-                name, website, emails = item[:3]
-                emails_str = ', '.join(emails) if isinstance(emails, list) else str(emails)
-                values.append([name, website, emails_str, 'N/A', 'N/A', 'N/A'])
-            elif len(item) == 6:  # TrustPilot results
-                values.append(list(item))
-            else:
-                logging.warning(f"Unexpected data format: {item}")
-        else:
-            logging.warning(f"Unexpected item type in data: {type(item)}")
-
-    body = {'values': values}
-    result = sheets_service.spreadsheets().values().update(
-        spreadsheetId=spreadsheet_id, range=f'{sheet_title}!A1',
-        valueInputOption='RAW', body=body).execute()
-    logging.info(f"{result.get('updatedCells')} cells updated.")
+    try:
+        async with get_session().post(f'https://api.telegram.org/bot{TOKEN}/sendDocument?chat_id={chat_id}',
+                                      data=form_data) as resp:
+            if resp.status != 200:
+                error_text = await resp.text()
+                logging.error(f"Failed to send CSV. Status: {resp.status}, Response: {error_text}")
+                return False
+            logging.info("CSV file sent successfully to Telegram")
+            return True
+    except Exception as e:
+        logging.error(f"Error sending CSV file to Telegram: {str(e)}")
+        return False
 
-    # Granting access
-    permission = {
-        'type': 'user',
-        'role': 'writer',
-        'emailAddress': 'Ivangul999@gmail.com'
-    }
-    drive_service.permissions().create(fileId=spreadsheet_id, body=permission).execute()
-    logging.info('Access granted to Ivangul999@gmail.com')
 
-    return spreadsheet_id
+async def create_google_sheet(leads, chat_id=None):
+    # Same columns as the CSV, one row per lead
+    return await sheets_exporter.export([lead.row() for lead in leads], chat_id)
 
 
 # Start the command to input the sender's email address
@@ -326,9 +286,10 @@ async def handle_email_theme(message: types.Message, state: FSMContext):
     with open('example.html', 'r', encoding='utf-8') as file:
         example = file.read()
 
-    draft = await generate_email_content(prompt, sender_email, phone_number, example)
+    # One call yields both subject and body; repeating a theme is answered from the LLM cache
+    generated = await generate_email_content(prompt, sender_email, phone_number, example)
+    subject, draft = generated if generated else (None, None)
     logger.info(f"Generated email content: {draft}")
-    subject, draft = await generate_email_content(prompt, sender_email, phone_number, example)
     if draft:
         await message.answer(
             f"Subject: {subject}\n\nHere is a draft based on your input:\n{draft}\nDo you approve this draft? Type 'yes' to approve, or provide your corrections.")
@@ -339,12 +300,19 @@ async def handle_email_theme(message: types.Message, state: FSMContext):
         await message.answer("Failed to generate draft, please try entering the theme again.")
 
 
+async def timed_stage(stage, coro):
+    started = time.monotonic()
+    result = await coro
+    logger.info(f"Draft stage '{stage}' took {time.monotonic() - started:.2f}s")
+    return result
+
+
 async def generate_email_content(prompt, sender_email, phone_number, example):
     try:
         logging.debug("Generating GPT response")
         context = f"Here is an example of email context: {example}"
         # Generate the email content
-        response = openai.ChatCompletion.create(
+        body_request = chat_completion(
             model="gpt-4o-mini",
             messages=[
                 {
@@ -367,10 +335,8 @@ async def generate_email_content(prompt, sender_email, phone_number, example):
             max_tokens=600
         )
 
-        content = response.choices[0].message['content'].strip().replace('```html', '').replace('```', '')
-
         # Extracting a suitable header from the prompt
-        header_response = openai.ChatCompletion.create(
+        subject_request = chat_completion(
             model="gpt-4o-mini",
             messages=[
                 {
@@ -388,7 +354,12 @@ async def generate_email_content(prompt, sender_email, phone_number, example):
             max_tokens=60
         )
 
-        header = header_response.choices[0].message['content'].strip()
+        # Body and subject don't depend on each other, so both requests run at once
+        response, header_response = await asyncio.gather(timed_stage("draft body", body_request),
+                                                         timed_stage("draft subject", subject_request))
+        content = response.strip().replace('```html', '').replace('```', '')
+        header = header_response.strip()
+        render_started = time.monotonic()
 
         # Split content into paragraphs
         paragraphs = content.split('\n\n')
@@ -434,6 +405,7 @@ async def generate_email_content(prompt, sender_email, phone_number, example):
         </html>
         """
 
+        logger.info(f"Draft stage 'render' took {time.monotonic() - render_started:.3f}s")
         return header, html_content
     except Exception as e:
         print(f"Error generating email content: {str(e)}")
@@ -468,8 +440,9 @@ async def choose_csv_source(message: types.Message, state: FSMContext):
             sender_email = data['sender_email']
             sender_password = data['password']
             draft = data['draft']
-            await send_emails_from_csv(sender_email, sender_password, 'Subject of your emails', draft, "default.csv")
-            await message.answer("Emails have been sent successfully using the default CSV.")
+            report = await send_emails_from_csv(sender_email, sender_password, 'Subject of your emails', draft,
+                                                "default.csv", message.chat.id)
+            await message.answer(f"Default CSV: {report}")
             await state.clear()
         else:
             await message.answer("Please type 'upload' to upload your CSV or 'default' to use the default CSV.")
@@ -496,18 +469,18 @@ async def handle_document(message: types.Message, state: FSMContext):
         sender_password = data['password']
         draft = data['draft']
         subject = data['subject']  # Получаем сохраненную тему
-        await send_emails_from_csv(sender_email, sender_password, subject, draft, unique_filename)
-        await message.answer(f"Emails have been sent successfully using your uploaded CSV: {unique_filename}.")
+        report = await send_emails_from_csv(sender_email, sender_password, subject, draft, unique_filename,
+                                            message.chat.id)
+        await message.answer(f"{unique_filename}: {report}")
         await state.clear()
     else:
         await message.answer("Please upload a CSV file.")
 
 
 # Updated function to read email addresses from a CSV file and send emails asynchronously
-async def send_emails_from_csv(sender_email, sender_password, subject, content, csv_filename):
-    """Asynchronously read email addresses from a CSV file and send emails via Gmail SMTP."""
-    success_count = 0
-    fail_count = 0
+async def send_emails_from_csv(sender_email, sender_password, subject, content, csv_filename, chat_id=None):
+    """Queue the CSV recipients as a durable campaign, send every row not yet delivered and return a summary."""
+    rows = []
 
     try:
         async with aiofiles.open(csv_filename, mode='r', encoding='utf-8') as csvfile:
@@ -516,60 +489,80 @@ async def send_emails_from_csv(sender_email, sender_password, subject, content,
             next(reader)  # Skip the header
 
             for row in reader:
-                print(f"Processing row: {row}")
                 if len(row) >= 3:
                     company_name = row[0]  # Extract the company name from the second column
                     recipient_email = row[2]    # Extract the email from the third column
-
-                    # Replace placeholders in the email content
-                    personalized_content = content.replace("[Recipient's Company]", company_name)
-
-                    print(f"--------To: {recipient_email} Content: {personalized_content}")
-                    success = send_email(sender_email, sender_password, recipient_email, subject, personalized_content)
-                    if success:
-                        success_count += 1
-                        print(f"Email successfully sent to {recipient_email}")
-                    else:
-                        fail_count += 1
+                    rows.append((company_name, recipient_email))
                 else:
                     print('Incomplete row found, skipping...')
 
     except Exception as e:
         print(f"Error reading file or processing data: {str(e)}")
+        return f"could not read the CSV file ({str(e)})."
+
+    campaign_id = make_campaign_id(sender_email, subject, content, rows)
+    added = await get_send_queue().enqueue(campaign_id, sender_email, subject, content, rows, chat_id)
+    logging.info(f"Campaign {campaign_id}: {added} new recipients queued out of {len(rows)}")
+    return await send_campaign(campaign_id, sender_email, sender_password, subject, content)
+
+
+async def send_campaign(campaign_id, sender_email, sender_password, subject, content):
+    progress = await run_campaign(campaign_id, sender_email, sender_password, subject, content)
+    print(f"Total emails processed: {progress['sent'] + progress['failed']}, Sent: {progress['sent']}, "
+          f"Failed: {progress['failed']}, Throughput: {progress['rate']:.2f} msg/s")
+    return campaign_report(campaign_id, progress)
+
+
+def campaign_report(campaign_id, progress):
+    if progress['auth_error']:
+        return (f"the mail server rejected the login, so sending stopped ({progress['auth_error']}). "
+                f"{progress['sent']} sent so far; use /resume {campaign_id} with the correct password to continue.")
+    report = f"{progress['sent']} emails sent, {progress['failed']} failed."
+    waiting = sum(count for state, count in progress.items() if state in ('pending', 'retrying', 'sending'))
+    if waiting:
+        report += f" {waiting} still waiting to be sent; use /resume {campaign_id} to continue."
+    return report
+
+
+# Resume an unfinished campaign from the subject and draft stored with it; a new draft would be a new campaign
+@router.message(Command("resume"))
+async def resume_command(message: types.Message, state: FSMContext, command: CommandObject):
+    queue = get_send_queue()
+    campaign_id = (command.args or '').strip()
+    if not campaign_id:
+        campaigns = await queue.unfinished_campaigns(message.chat.id)
+        if not campaigns:
+            await message.answer("There are no unfinished campaigns started from this chat.")
+            return
+        lines = [f"{campaign_id} from {sender_email}: \"{subject}\", {remaining} emails left"
+                 for campaign_id, sender_email, subject, remaining in campaigns]
+        await message.answer("Unfinished campaigns:\n" + "\n".join(lines) + "\n\nSend /resume <id> to continue one.")
+        return
 
-    print(f"Total emails processed: {success_count + fail_count}, Sent: {success_count}, Failed: {fail_count}")
-
-
-# Function to send an email via SMTP
-def send_email(sender_email, sender_password, recipient_email, subject, content):
-    print("Preparing message content...")
-
-    # Create the email message object with UTF-8 encoding
-    msg = MIMEText(content, 'html', 'utf-8')
-
-    # Set other headers with UTF-8 encoding
-    msg['Subject'] = Header(subject, 'utf-8')
-    msg['From'] = sender_email
-    msg['To'] = recipient_email
-
-    smtp_server = "smtp.gmail.com"
-    smtp_port = 587
-
-    try:
-        print("Connecting to SMTP server...")
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            print("Logging in...")
-            server.login(sender_email, sender_password)
-            print("Sending email...")
-            server.send_message(msg)
-            print(f"Email successfully sent to {recipient_email} using {smtp_server}!")
-            return True
-    except Exception as e:
-        print(f"Failed to send email via {smtp_server}: {str(e)}")
-        return False
+    campaign = await queue.campaign(campaign_id, message.chat.id)
+    if campaign is None:
+        await message.answer(f"No campaign {campaign_id} was started from this chat. Send /resume to list them.")
+        return
+    await state.update_data(campaign_id=campaign_id)
+    await message.answer(f"Resuming campaign {campaign_id} from {campaign[0]}. "
+                         f"Please enter the password for SMTP authentication:")
+    await state.set_state(ResumeStates.awaiting_password)
+
+
+@router.message(ResumeStates.awaiting_password)
+async def handle_resume_password(message: types.Message, state: FSMContext):
+    campaign_id = (await state.get_data())['campaign_id']
+    await state.clear()
+    queue = get_send_queue()
+    campaign = await queue.campaign(campaign_id, message.chat.id)
+    if campaign is None:
+        await message.answer(f"Campaign {campaign_id} is no longer available.")
+        return
+    sender_email, subject, content = campaign
+    # As with sending the same CSV again, rows that failed last time are tried once more
+    await queue.rearm_failed(campaign_id)
+    report = await send_campaign(campaign_id, sender_email, message.text, subject, content)
+    await message.answer(f"Campaign {campaign_id}: {report}")
 
 
 @router.message(Command("send_answer"))
@@ -599,7 +592,7 @@ async def answer_text(message: types.Message, state: FSMContext):
 
 async def generate_answer_draft(text):
     try:
-        response = openai.ChatCompletion.create(
+        response = await chat_completion(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "Create a professional and polite response to the following inquiry"
@@ -611,7 +604,7 @@ async def generate_answer_draft(text):
             ],
             max_tokens=300
         )
-        content = response.choices[0].message['content'].strip()
+        content = response.strip()
         # Split content into paragraphs
         paragraphs = content.split('\n\n')
         formatted_content = ''.join(f'<p>{para}</p>' for para in paragraphs)
@@ -658,7 +651,7 @@ async def handle_password(message: types.Message, state: FSMContext):
     sender_password = data['password']
 
     subject = "Response to your inquiry"
-    success = send_email_answer(sender_email, sender_password, recipient_email, subject, draft)
+    success = await send_email_answer(sender_email, sender_password, recipient_email, subject, draft)
     if success:
         await message.answer(f"Your answer has been sent to {recipient_email}.")
     else:
@@ -667,36 +660,9 @@ async def handle_password(message: types.Message, state: FSMContext):
     await state.clear()  # Clear the state
 
 
-# Function to send an email via SMTP
-def send_email_answer(sender_email, sender_password, recipient_email, subject, content):
-    print("Preparing message content...")
-
-    # Create the email message object with UTF-8 encoding
-    msg = MIMEText(content, 'html', 'utf-8')
-
-    # Set other headers with UTF-8 encoding
-    msg['Subject'] = Header(subject, 'utf-8')
-    msg['From'] = sender_email
-    msg['To'] = recipient_email
-
-    smtp_server = "smtp.gmail.com"
-    smtp_port = 587
-
-    try:
-        print("Connecting to SMTP server...")
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            print("Logging in...")
-            server.login(sender_email, sender_password)
-            print("Sending email...")
-            server.send_message(msg)
-            print(f"Email successfully sent to {recipient_email} using {smtp_server}!")
-            return True
-    except Exception as e:
-        print(f"Failed to send email via {smtp_server}: {str(e)}")
-        return False
+# Function to send an email via the pooled SMTP engine
+async def send_email_answer(sender_email, sender_password, recipient_email, subject, content):
+    return await send_message(sender_email, sender_password, recipient_email, subject, content)
 
 
 def is_valid_email_answer(email):
@@ -712,6 +678,15 @@ def extract_code_from_message(text):
     return None
 
 
+background_tasks = set()
+
+
+async def warm_up_clients():
+    warm_up = asyncio.gather(*[resource.warm() for resource in (gmaps, sheets_service, drive_service)])
+    background_tasks.add(warm_up)
+    warm_up.add_done_callback(background_tasks.discard)
+
+
 # Main function to start the bot.
 async def main():
     dp = Dispatcher()
@@ -720,7 +695,19 @@ async def main():
     dp.include_router(router_search)
     dp.include_router(router_answer)
     dp.include_router(router_linkedin)
-    await dp.start_polling(bot)
+    # Clients are created lazily; warm them in the background once polling has started
+    dp.startup.register(warm_up_clients)
+    for campaign_id, sender_email, _, remaining in await get_send_queue().unfinished_campaigns():
+        logging.info(f"Unfinished campaign {campaign_id} from {sender_email}: {remaining} emails left, "
+                     f"resume it with /resume {campaign_id} from the chat that started it")
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await close_pools()
+        await close_session()
+        shutdown_parse_pool()
+        transcription_service.shutdown()
+        close_stores()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,79 @@
+"""Compare the legacy email extraction with email_extraction.parse_html over saved HTML pages.
+
+Usage: python benchmarks/bench_email_extraction.py [page.html | directory ...]
+
+Without arguments the corpus is example.html, the pages in benchmarks/pages (contact, imprint and
+home pages as WordPress, Wix, Squarespace, Shopify, Jimdo and hand-written sites render them, with
+addresses in body text, mailto links, JSON-LD and inline state scripts) plus a synthetic heavy page
+(inline JS bundle and base64 images around a few real contact addresses). Exits non-zero if any
+email found by the legacy code is missing from the new result.
+"""
+import base64
+import glob
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from email_extraction import IGNORE_PATTERNS, parse_html  # noqa: E402
+
+
+def legacy_parse_html(html_content):
+    emails = set(re.findall(r"\b[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]{2,}\b", html_content))
+    return [email for email in emails if not any(re.search(pattern, email) for pattern in IGNORE_PATTERNS)]
+
+
+def heavy_page():
+    rng = random.Random(0)
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example.html'), encoding='utf-8') as f:
+        page = f.read()
+    identifiers = ['e.exports', 'n.d', 'o.default', 'r.prototype.call', 'window.__INITIAL_STATE__']
+    bundle = ';'.join(f"{rng.choice(identifiers)}.x{i}=function(t){{return t.a{i}||'{i}'}}" for i in range(40000))
+    bundle += ';var dsn="https://abc123@o12345.ingest.sentry.io/42";var img="logo@2x.png"'
+    image = base64.b64encode(rng.randbytes(1_500_000)).decode()
+    contacts = ('<footer><p>Write to info@maverlyn-example.com or '
+                '<a href="mailto:sales@maverlyn-example.com">sales</a></p></footer>')
+    return page.replace('</body>', f'<script>{bundle}</script><img src="data:image/png;base64,{image}">'
+                                   f'{contacts}</body>')
+
+
+def load_corpus(paths):
+    corpus = {}
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, '*.html'))) if os.path.isdir(path) else [path]
+        for name in files:
+            with open(name, encoding='utf-8', errors='replace') as f:
+                corpus[name] = f.read()
+    return corpus
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = sys.argv[1:] or [os.path.join(here, '..', 'example.html'), os.path.join(here, 'pages')]
+    corpus = load_corpus(paths)
+    if not sys.argv[1:]:
+        corpus['<synthetic heavy page>'] = heavy_page()
+
+    lost_any = False
+    total_legacy = total_new = 0.0
+    for name, html in corpus.items():
+        runs = 3
+        legacy = timeit.timeit(lambda: legacy_parse_html(html), number=runs) / runs
+        new = timeit.timeit(lambda: parse_html(html), number=runs) / runs
+        total_legacy += legacy
+        total_new += new
+        lost = set(legacy_parse_html(html)) - set(parse_html(html))
+        lost_any = lost_any or bool(lost)
+        print(f"{name}: {len(html) / 1024:.0f} KiB, legacy {legacy * 1000:.1f} ms, new {new * 1000:.1f} ms, "
+              f"speedup {legacy / new if new else float('inf'):.1f}x, lost emails: {sorted(lost) or 'none'}")
+
+    print(f"Total: legacy {total_legacy * 1000:.1f} ms, new {total_new * 1000:.1f} ms, "
+          f"speedup {total_legacy / total_new if total_new else float('inf'):.1f}x")
+    return 1 if lost_any else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
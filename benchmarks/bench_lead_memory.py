@@ -0,0 +1,71 @@
+"""Compare the memory held by search results as Lead objects versus the old (source, tuple) pairs.
+
+Usage: python benchmarks/bench_lead_memory.py [--leads N]
+
+Builds N synthetic Google Maps and TrustPilot results in both shapes and reports the traced
+allocation per lead. The field strings are shared between the shapes; the per-lead email list
+that the website scraper produces is built inside each measurement, as it is in a real search.
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from leads import Lead  # noqa: E402
+
+
+def make_fields(count):
+    fields = []
+    for i in range(count):
+        fields.append((f'Company {i}', f'https://company{i}.example', f'info@company{i}.example',
+                       f'+1 555 {i:07d}', f'{i} Main Street, Springfield', f'{i % 50 / 10:.1f}', str(i % 900)))
+    return fields
+
+
+def as_tuples(fields):
+    results = []
+    for idx, (name, website, email, phone, location, rating, reviews) in enumerate(fields):
+        if idx % 2:
+            results.append(('TrustPilot', (name, rating, email, phone, location, 'True', website, reviews)))
+        else:
+            results.append(('Google Maps', (name, website, [email], phone, location, reviews)))
+    return results
+
+
+def as_leads(fields):
+    results = []
+    for idx, (name, website, email, phone, location, rating, reviews) in enumerate(fields):
+        if idx % 2:
+            results.append(Lead(name, website, email, phone, location, rating, reviews, 'True',
+                                sources=('TrustPilot',)))
+        else:
+            results.append(Lead(name, website, [email], phone, location, reviews=reviews, sources=('Google Maps',)))
+    return results
+
+
+def measure(build, fields):
+    tracemalloc.start()
+    results = build(fields)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--leads', type=int, default=100000)
+    args = parser.parse_args()
+
+    fields = make_fields(args.leads)
+    tuples = measure(as_tuples, fields)
+    leads = measure(as_leads, fields)
+    print(f"(source, tuple) pairs: {tuples / args.leads:.0f} bytes/lead, {tuples / 2 ** 20:.1f} MiB total")
+    print(f"Lead objects:          {leads / args.leads:.0f} bytes/lead, {leads / 2 ** 20:.1f} MiB total")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
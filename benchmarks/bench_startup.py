@@ -0,0 +1,51 @@
+"""Measure how long a fresh interpreter takes to import app.py (bot startup before polling).
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--max-seconds S]
+
+Each run imports app in a new process, so import-time work such as model loading or API client
+construction shows up directly. With --max-seconds the script exits non-zero when the median is
+slower, which makes it usable as a regression check in CI.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Well-formed placeholders so importing app doesn't fail on missing configuration
+PLACEHOLDER_ENV = {
+    'TELEGRAM_TOKEN': '123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA',
+    'OPENAI_API_KEY': 'sk-benchmark',
+    'GOOGLE_MAPS_API_KEY': 'AIzaBenchmark',
+    'SEND_QUEUE_DB': ':memory:',
+    'WEBSITE_CACHE_DB': ':memory:',
+}
+
+
+def time_import():
+    env = {**PLACEHOLDER_ENV, **os.environ}
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import app'], cwd=ROOT, env=env, check=True)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=None)
+    args = parser.parse_args()
+
+    timings = [time_import() for _ in range(args.runs)]
+    median = statistics.median(timings)
+    print(f"import app: median {median:.2f}s, min {min(timings):.2f}s, max {max(timings):.2f}s over {args.runs} runs")
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"Startup regression: median {median:.2f}s exceeds {args.max_seconds:.2f}s")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""Compare BeautifulSoup backends for TrustPilot field extraction.
+
+Usage: python benchmarks/bench_trustpilot_parsing.py [company_page.html ...]
+
+Saved TrustPilot company pages can be passed as arguments; without them a synthetic company page and
+listing page using the live site's class names are generated. Every backend must return exactly
+the fields produced by the default html.parser full-tree parse, otherwise the script exits non-zero.
+"""
+import importlib.util
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from trustpilot_parsing import parse_company_page, parse_listing_page  # noqa: E402
+
+BACKENDS = [('html.parser', False), ('html.parser', True)]
+if importlib.util.find_spec('lxml'):
+    BACKENDS += [('lxml', False), ('lxml', True)]
+
+
+def filler(count):
+    return ''.join(f'<div class="styles_reviewCard__{i}"><section><p class="typography_body-m__xgxZ_ review">'
+                   f'Review text number {i} with <b>markup</b> and <a href="/users/{i}">a user link</a></p>'
+                   f'<img src="/img/{i}.png" alt=""></section></div>' for i in range(count))
+
+
+def company_page():
+    return (
+        '<html><head><title>Acme.com reviews</title><script>window.__NEXT_DATA__={"props":{}}</script></head><body>'
+        + filler(400) +
+        '<p class="typography_body-l__KUYFJ typography_appearance-subtle__8_H2l" data-rating-typography="true">4.3</p>'
+        '<span class="typography_body-l__KUYFJ typography_appearance-subtle__8_H2l styles_text__W4hWi">1,234 reviews</span>'
+        '<button class="styles_verificationLabel__kukuk">Verified</button>'
+        '<a class="link_internal__7XN06 link_wrapper__5ZJEx" href="https://acme.com">acme.com</a>'
+        '<a href="mailto:support@acme.com">support@acme.com</a><a href="tel:+1 (555) 010-2030">+1 (555) 010-2030</a>'
+        '<ul class="styles_contactInfoAddressList__RxiJI"><li>1 Main St,</li><li>Springfield</li><li>US</li></ul>'
+        + filler(400) + '</body></html>')
+
+
+def listing_page():
+    cards = ''.join(f'<a name="business-unit-card" href="/review/company{i}.com"><div>'
+                    f'<p class="typography_heading-xs__jSwUz">Company{i}.com</p></div></a>' for i in range(20))
+    return ('<html><body><p class="typography_body-m__xgxZ_">1200 results</p>' + filler(200) + cards
+            + filler(200) + '</body></html>')
+
+
+def main():
+    pages = []
+    for path in sys.argv[1:]:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            pages.append((path, parse_company_page, f.read()))
+    if not pages:
+        pages = [('<synthetic company page>', parse_company_page, company_page()),
+                 ('<synthetic listing page>', parse_listing_page, listing_page())]
+
+    mismatch = False
+    for name, parse_func, html in pages:
+        expected = parse_func(html)
+        baseline = None
+        for parser, strained in BACKENDS:
+            runs = 5
+            elapsed = timeit.timeit(lambda: parse_func(html, parser, strained), number=runs) / runs
+            baseline = baseline or elapsed
+            same = parse_func(html, parser, strained) == expected
+            mismatch = mismatch or not same
+            label = f"{parser}{' + strainer' if strained else ''}"
+            print(f"{name} ({len(html) / 1024:.0f} KiB) {label:<24} {elapsed * 1000:7.1f} ms  "
+                  f"{baseline / elapsed:4.1f}x  {'identical' if same else 'MISMATCH'}")
+    return 1 if mismatch else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
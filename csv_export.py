@@ -0,0 +1,38 @@
+import csv
+import io
+import os
+import tempfile
+from dotenv import load_dotenv
+from leads import Lead
+
+load_dotenv()
+
+# The encoded CSV stays in memory up to this size, after which it is spooled to a temp file
+CSV_SPOOL_MAX_MEMORY = int(os.environ.get("CSV_SPOOL_MAX_MEMORY", 1024 * 1024))
+
+
+class CsvResultWriter:
+    """Writes result rows into a spooled temp file that is uploaded as-is.
+
+    This bounds the encoded CSV and spares the upload a second in-memory copy of it. The Lead objects are
+    not bounded: they are written once, after entity resolution, which needs every source's results at once.
+    """
+
+    def __init__(self):
+        self.file = tempfile.SpooledTemporaryFile(max_size=CSV_SPOOL_MAX_MEMORY, mode='w+b')
+        self.text = io.TextIOWrapper(self.file, encoding='utf-8', newline='', write_through=True)
+        self.writer = csv.writer(self.text, quoting=csv.QUOTE_ALL)
+        self.writer.writerow(Lead.HEADER)
+        self.rows = 0
+
+    def write_leads(self, leads):
+        self.writer.writerows(lead.row() for lead in leads)
+        self.rows += len(leads)
+
+    def open_for_upload(self):
+        self.text.flush()
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        self.text.close()
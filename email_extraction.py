@@ -0,0 +1,135 @@
+import re
+
+EMAIL_PATTERN = re.compile(r"\b[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]{2,}\b")
+
+LINK_PATTERN = re.compile(r"""<a\b[^>]*?\bhref\s*=\s*["']([^"'#>]+)""", re.IGNORECASE)
+
+# Inline JS (JSON-LD is kept whole, it often carries the business email). Site builders also put the
+# contact address in inline state scripts, so only the text around each '@' in a script is searched
+SCRIPT_PATTERN = re.compile(
+    r"<script\b(?![^>]*application/ld\+json)[^>]*>[^<]*(?:<(?!/script\s*>)[^<]*)*</script\s*>", re.IGNORECASE)
+# The local part of an address is at most 64 characters and the domain at most 255
+LOCAL_PART_MAX, DOMAIN_MAX = 64, 255
+
+# Regions that never hold a contact address but make up most of a heavy page: stylesheets, comments
+# and base64-encoded assets. Separate passes with unrolled loops are several times faster than one
+# alternation with lazy .*?
+NON_TEXT_PATTERNS = [
+    re.compile(r"<style\b[^>]*>[^<]*(?:<(?!/style\s*>)[^<]*)*</style\s*>", re.IGNORECASE),
+    re.compile(r"<!--.*?-->", re.DOTALL),
+    re.compile(r"data:[a-zA-Z0-9.+/-]+;base64,[a-zA-Z0-9+/=]*"),
+]
+
+IGNORE_PATTERNS = [
+    r'sentry\..+',
+    r'wixpress\.com',
+    r'polyfill\.io',
+    r'lodash\.com',
+    r'core-js-bundle\.com',
+    r'react-dom\.com',
+    r'react\.com',
+    r'npm\.js',
+    r'@[a-zA-Z0-9]*[0-9]{5,}@',
+    r'\b[a-zA-Z]+@[0-9]+\.[0-9]+\.[0-9]+\b',
+    r'@\w*\.png',
+    r'@\w*\.jpg',
+    r'@\w*\.jpeg',
+    r'@\w*\.gif',
+    r'\w+-v\d+@3x-\d+x\d+\.png',
+    r'\w+-v\d+@3x-\d+x\d+\.png.webp',
+    r'[a-zA-Z0-9_\-]+@[0-9]+x[0-9]+\.png',
+    r'[a-zA-Z0-9_\-]+@[0-9]+x[0-9]+\.jpeg',
+    r'[a-zA-Z0-9_\-]+@[0-9]+x[0-9]+\.png.webp',
+    r'[a-zA-Z0-9_\-]+@[\d]+x[\d]+\.png',
+    r'[a-zA-Z0-9_\-]+@\d+x\d+\.(png|jpg|jpeg|gif)',
+    r'[a-zA-Z0-9_\-]+-v\d+_?\d*@[0-9]+x[0-9]+\.png',
+    r'[a-zA-Z0-9_\-]+-v\d+_?\d*@[0-9]+x[0-9]+\.png.webp',
+    r'IASC',
+    r'@\w*\.png.webp',
+    r'Mesa-de-trabajo'
+]
+
+# One alternation matches exactly when any of the individual patterns would
+IGNORE_PATTERN = re.compile('|'.join(f'(?:{pattern})' for pattern in IGNORE_PATTERNS))
+
+
+def script_emails(script):
+    # Minified bundles are mostly code; the full pattern only runs on a short window around each '@'
+    emails = []
+    at = script.find('@')
+    while at != -1:
+        end = at + DOMAIN_MAX + 1
+        match = EMAIL_PATTERN.search(script, max(at - LOCAL_PART_MAX, 0), end)
+        while match and match.end() <= at:
+            match = EMAIL_PATTERN.search(script, match.end(), end)
+        if match and match.start() < at:
+            emails.append(match.group())
+            at = script.find('@', match.end())
+        else:
+            at = script.find('@', at + 1)
+    return emails
+
+
+def replace_script(match):
+    return ' ' + ' '.join(script_emails(match.group())) + ' '
+
+
+def strip_non_text(html_content):
+    html_content = SCRIPT_PATTERN.sub(replace_script, html_content)
+    for pattern in NON_TEXT_PATTERNS:
+        html_content = pattern.sub(' ', html_content)
+    return html_content
+
+
+def parse_html(html_content):
+    emails = set(EMAIL_PATTERN.findall(strip_non_text(html_content)))
+    return filter_emails(emails)
+
+
+def filter_emails(emails):
+    return [email for email in emails if not IGNORE_PATTERN.search(email)]
+
+
+class StreamingEmailExtractor:
+    """Extracts emails from HTML fed in chunks, holding back only the part that may continue in the next chunk."""
+
+    BLOCKS = (('<script', '</script'), ('<style', '</style'), ('<!--', '-->'))
+
+    def __init__(self):
+        self.buffer = ''
+        self.candidates = set()
+        self.links = set()
+
+    def _safe_cut(self):
+        # An address never contains '<', so text up to the last tag start can be scanned now,
+        # unless that point is inside a script, style or comment that has not been closed yet
+        cut = self.buffer.rfind('<')
+        if cut <= 0:
+            return 0
+        lowered = self.buffer.lower()
+        for opener, closer in self.BLOCKS:
+            start = lowered.rfind(opener, 0, cut)
+            if start != -1 and lowered.find(closer, start, cut) == -1:
+                cut = min(cut, start)
+        return cut
+
+    def feed(self, text):
+        self.buffer += text
+        cut = self._safe_cut()
+        if cut:
+            self._scan(self.buffer[:cut])
+            self.buffer = self.buffer[cut:]
+
+    def _scan(self, html_content):
+        text = strip_non_text(html_content)
+        self.candidates.update(EMAIL_PATTERN.findall(text))
+        self.links.update(LINK_PATTERN.findall(text))
+
+    @property
+    def emails(self):
+        return filter_emails(self.candidates)
+
+    def close(self):
+        self._scan(self.buffer)
+        self.buffer = ''
+        return self.emails
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import os
+from email.header import Header
+from email.mime.text import MIMEText
+import aiosmtplib
+from dotenv import load_dotenv
+from rate_limiter import get_rate_limiter
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# SMTP settings; override host/port to point the engine at a local SMTP stand-in
+SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 587))
+SMTP_START_TLS = os.environ.get("SMTP_START_TLS", "true").lower() == "true"
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", 30))
+
+# Authenticated connections kept open per sender, and messages in flight per campaign
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", 3))
+SMTP_CONCURRENCY = int(os.environ.get("SMTP_CONCURRENCY", 10))
+
+
+def build_message(sender_email, recipient_email, subject, content):
+    # Create the email message object with UTF-8 encoding
+    msg = MIMEText(content, 'html', 'utf-8')
+
+    # Set other headers with UTF-8 encoding
+    msg['Subject'] = Header(subject, 'utf-8')
+    msg['From'] = sender_email
+    msg['To'] = recipient_email
+    return msg
+
+
+class SMTPConnectionPool:
+    """Bounded pool of logged-in SMTP connections for a single sender account."""
+
+    def __init__(self, sender_email, sender_password, hostname=SMTP_SERVER, port=SMTP_PORT,
+                 size=SMTP_POOL_SIZE, start_tls=SMTP_START_TLS):
+        self.sender_email = sender_email
+        self.sender_password = sender_password
+        self.hostname = hostname
+        self.port = port
+        self.start_tls = start_tls
+        self._slots = asyncio.Semaphore(size)
+        self._idle = []
+        # Set once the server rejects the login; the same credentials are not tried again
+        self.auth_error = None
+        # Until a login has succeeded, connections are opened one at a time so a bad password is tried once
+        self._logged_in = False
+        self._first_login = asyncio.Lock()
+
+    async def _connect(self):
+        if self._logged_in:
+            return await self._open()
+        async with self._first_login:
+            if self.auth_error is not None:
+                raise self.auth_error
+            client = await self._open()
+            self._logged_in = True
+            return client
+
+    async def _open(self):
+        logger.info(f"Opening SMTP connection to {self.hostname}:{self.port} for {self.sender_email}")
+        client = aiosmtplib.SMTP(hostname=self.hostname, port=self.port, start_tls=self.start_tls,
+                                 timeout=SMTP_TIMEOUT)
+        await client.connect()
+        if self.sender_password:
+            try:
+                await client.login(self.sender_email, self.sender_password)
+            except Exception as e:
+                if is_auth_error(e):
+                    self.auth_error = e
+                await self._discard(client)
+                raise
+        return client
+
+    async def _discard(self, client):
+        try:
+            await client.quit()
+        except Exception:
+            client.close()
+
+    async def send(self, msg):
+        async with self._slots:
+            if self.auth_error is not None:
+                raise self.auth_error
+            client = self._idle.pop() if self._idle else None
+            if client is None or not client.is_connected:
+                client = await self._connect()
+            try:
+                await client.send_message(msg)
+            except Exception as e:
+                if is_envelope_error(e) and client.is_connected:
+                    self._idle.append(client)
+                else:
+                    await self._discard(client)
+                raise
+            self._idle.append(client)
+
+    async def close(self):
+        while self._idle:
+            await self._discard(self._idle.pop())
+
+
+_pools = {}
+
+
+def get_pool(sender_email, sender_password):
+    pool = _pools.get(sender_email)
+    if pool is None or pool.sender_password != sender_password:
+        if pool is not None:
+            asyncio.create_task(pool.close())
+        pool = SMTPConnectionPool(sender_email, sender_password)
+        _pools[sender_email] = pool
+    return pool
+
+
+async def close_pools():
+    for pool in list(_pools.values()):
+        await pool.close()
+    _pools.clear()
+
+
+def is_transient_error(error):
+    # 4xx replies, dropped connections and timeouts are worth retrying; 5xx replies are not
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(400 <= refused.code < 500 for refused in error.recipients)
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return 400 <= error.code < 500
+    return isinstance(error, (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError,
+                              aiosmtplib.SMTPTimeoutError, OSError, asyncio.TimeoutError))
+
+
+def is_envelope_error(error):
+    # A refused sender, recipient or message: aiosmtplib has sent RSET and the session stays usable.
+    # 421 means the server is closing the connection
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, aiosmtplib.SMTPResponseException) and error.code != 421
+
+
+def is_auth_error(error):
+    # A rejected login fails every message of the campaign the same way, so it is not a per-row failure
+    if isinstance(error, aiosmtplib.SMTPAuthenticationError):
+        return True
+    return isinstance(error, aiosmtplib.SMTPResponseException) and error.code in (530, 534, 535)
+
+
+async def deliver(sender_email, sender_password, recipient_email, subject, content, pace=True):
+    # pace=False is for callers that already hold a slot from the sender's rate limiter
+    msg = build_message(sender_email, recipient_email, subject, content)
+    pool = get_pool(sender_email, sender_password)
+    if pace:
+        await get_rate_limiter(sender_email).acquire()
+    await pool.send(msg)
+    logger.info(f"Email successfully sent to {recipient_email} using {pool.hostname}")
+
+
+async def send_message(sender_email, sender_password, recipient_email, subject, content):
+    try:
+        await deliver(sender_email, sender_password, recipient_email, subject, content)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to send email to {recipient_email}: {str(e)}")
+        return False
@@ -0,0 +1,124 @@
+import logging
+import os
+import re
+from fuzzywuzzy import fuzz
+from dotenv import load_dotenv
+from leads import Lead
+from trustpilot_parsing import clean_phone_number
+from website_cache import site_key
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Minimum fuzz.ratio between normalized names for two leads in a name block to be merged
+ER_NAME_THRESHOLD = int(os.environ.get("ER_NAME_THRESHOLD", 90))
+# Name-token blocks bigger than this ("dental", "services", ...) are too generic to compare pairwise
+ER_MAX_BLOCK_SIZE = int(os.environ.get("ER_MAX_BLOCK_SIZE", 200))
+# Phones are compared on their last digits so "+44 20 ..." and "020 ..." land in the same block
+PHONE_KEY_DIGITS = 9
+
+# Name preference when merging: TrustPilot names lose their .com/.ai part and get re-capitalized
+NAME_PRIORITY = {'Google Maps': 0, 'TrustPilot': 1}
+NAME_STOPWORDS = {'the', 'and', 'of', 'inc', 'llc', 'ltd', 'limited', 'gmbh', 'co', 'corp', 'company',
+                  'com', 'ai', 'io', 'net', 'org', 'plc', 'sa', 'ag', 'bv', 'srl'}
+
+
+def normalize_name(name):
+    name = re.sub(r'\.(com|ai|io|net|org)\b', ' ', str(name or '').lower())
+    tokens = re.findall(r'[a-z0-9]+', name)
+    return ' '.join(token for token in tokens if token not in NAME_STOPWORDS)
+
+
+def blocking_keys(record):
+    keys = []
+    site = site_key(record.website) if record.website else None
+    if site:
+        keys.append('d:' + site)
+    if record.phone:
+        digits = clean_phone_number(str(record.phone))
+        if len(digits) >= 7:
+            keys.append('p:' + digits[-PHONE_KEY_DIGITS:])
+    keys.extend('e:' + email.strip().lower() for email in record.emails)
+    return keys
+
+
+def conflicts(a, b):
+    # Different websites or phones on both sides mean different businesses, however alike the names
+    if a.website and b.website and site_key(a.website) != site_key(b.website):
+        return True
+    if a.phone and b.phone:
+        a_digits, b_digits = clean_phone_number(str(a.phone)), clean_phone_number(str(b.phone))
+        if a_digits and b_digits and a_digits[-PHONE_KEY_DIGITS:] != b_digits[-PHONE_KEY_DIGITS:]:
+            return True
+    return False
+
+
+def merge(records):
+    if len(records) == 1:
+        return records[0]
+    records = sorted(records, key=lambda record: NAME_PRIORITY.get(record.sources[0], len(NAME_PRIORITY)))
+    values = {field: next((getattr(record, field) for record in records if getattr(record, field) is not None), None)
+              for field in Lead.FIELDS if field != 'emails'}
+    emails = dict.fromkeys(email for record in records for email in record.emails)
+    sources = dict.fromkeys(source for record in records for source in record.sources)
+    return Lead(emails=tuple(emails), sources=tuple(sources), **values)
+
+
+def resolve_leads(records):
+    """Merge leads describing the same company into one Lead per company.
+
+    Leads sharing a domain, phone or email are merged unless their websites or phones disagree. Leads sharing a name token are
+    fuzzy-compared only against the other members of that token's block, so the work grows with
+    block sizes rather than with the square of the number of leads.
+    """
+    parent = list(range(len(records)))
+
+    def find(idx):
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+
+    def union(a, b):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[root_b] = root_a
+
+    exact_blocks = {}
+    for idx, record in enumerate(records):
+        for key in blocking_keys(record):
+            exact_blocks.setdefault(key, []).append(idx)
+    for members in exact_blocks.values():
+        for idx in members[1:]:
+            # A shared email or phone still must not join leads whose websites or phones disagree
+            if not conflicts(records[members[0]], records[idx]):
+                union(members[0], idx)
+
+    names = [normalize_name(record.name) for record in records]
+    name_blocks = {}
+    for idx, name in enumerate(names):
+        for token in set(name.split()):
+            name_blocks.setdefault(token, []).append(idx)
+
+    comparisons = 0
+    for token, members in name_blocks.items():
+        if len(members) < 2:
+            continue
+        if len(members) > ER_MAX_BLOCK_SIZE:
+            logger.info(f"Skipping name block '{token}' with {len(members)} leads")
+            continue
+        for pos, a in enumerate(members):
+            for b in members[pos + 1:]:
+                if find(a) == find(b) or conflicts(records[a], records[b]):
+                    continue
+                comparisons += 1
+                if fuzz.ratio(names[a], names[b]) >= ER_NAME_THRESHOLD:
+                    union(a, b)
+
+    clusters = {}
+    for idx in range(len(records)):
+        clusters.setdefault(find(idx), []).append(records[idx])
+    merged = [merge(cluster) for cluster in clusters.values()]
+    logger.info(f"Entity resolution: {len(records)} leads -> {len(merged)} companies, "
+                f"{comparisons} name comparisons")
+    return merged
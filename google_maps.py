@@ -1,125 +1,301 @@
 import asyncio
+import codecs
 import logging
 import os
-import re
+from urllib.parse import urljoin, urlparse
+import aiohttp
 import googlemaps
 from dotenv import load_dotenv
-from aiogram.client.session import aiohttp
+from email_extraction import StreamingEmailExtractor
+from http_client import get_session
+from lead_store import get_lead_store
+from leads import Lead
+from places_cache import get_places_cache, normalize_query
+from lazy import LazyResource
+from website_cache import get_website_cache, normalize_domain, site_key
 
 logger = logging.getLogger(__name__)
 load_dotenv()
 GOOGLE_MAPS_API_KEY = os.environ.get("GOOGLE_MAPS_API_KEY")
 
-# Initialize Google Maps client
-gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
+# Google Maps client, created on first use
+gmaps = LazyResource('Google Maps client', lambda: googlemaps.Client(key=GOOGLE_MAPS_API_KEY))
 
 # Ключ API и ID поисковой системы для Google Custom Search
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 GOOGLE_CX = os.environ.get("GOOGLE_CX")
 
+# Maximum number of place-details requests in flight across all searches
+PLACE_DETAILS_CONCURRENCY = int(os.environ.get("PLACE_DETAILS_CONCURRENCY", 10))
+PLACE_DETAILS_FIELDS = ['name', 'website', 'formatted_phone_number', 'formatted_address', 'user_ratings_total']
+place_details_limiter = asyncio.Semaphore(PLACE_DETAILS_CONCURRENCY)
+
+# Polling for a text-search next_page_token to become valid: first wait, backoff cap and give-up time
+PAGE_TOKEN_POLL_DELAY = float(os.environ.get("PAGE_TOKEN_POLL_DELAY", 0.5))
+PAGE_TOKEN_POLL_MAX_DELAY = float(os.environ.get("PAGE_TOKEN_POLL_MAX_DELAY", 2))
+PAGE_TOKEN_TIMEOUT = float(os.environ.get("PAGE_TOKEN_TIMEOUT", 15))
+
+# Limits for downloading a company homepage while looking for contact emails
+WEBSITE_MAX_BYTES = int(os.environ.get("WEBSITE_MAX_BYTES", 2 * 1024 * 1024))
+WEBSITE_MAX_EMAILS = int(os.environ.get("WEBSITE_MAX_EMAILS", 5))
+WEBSITE_CHUNK_SIZE = 64 * 1024
+# Extra same-site pages tried when the homepage has no address, and the time allowed for them
+CONTACT_MAX_PAGES = int(os.environ.get("CONTACT_MAX_PAGES", 3))
+CONTACT_CRAWL_TIMEOUT = float(os.environ.get("CONTACT_CRAWL_TIMEOUT", 20))
+CONTACT_PAGE_KEYWORDS = [
+    ('contact', 3), ('kontakt', 3), ('impressum', 3), ('imprint', 3),
+    ('about', 2), ('ueber-uns', 2), ('uber-uns', 2), ('company', 1), ('team', 1), ('legal', 1),
+]
+website_timeout = aiohttp.ClientTimeout(total=float(os.environ.get("WEBSITE_TOTAL_TIMEOUT", 30)),
+                                        sock_connect=float(os.environ.get("WEBSITE_CONNECT_TIMEOUT", 10)),
+                                        sock_read=float(os.environ.get("WEBSITE_READ_TIMEOUT", 15)))
+
 
 async def google_search_and_extract(query):
     all_results = []
-    search_result = await fetch_places(query)
-
-    while True:
+    async for search_result in iter_search_pages(query):
         info = await process_search_results(search_result)
         all_results.extend(info)
 
-        if 'next_page_token' not in search_result:
-            break
+    return all_results
 
-        await asyncio.sleep(2)  # Delay to respect API limits
-        search_result = await fetch_places(query, search_result['next_page_token'])
 
-    return all_results
+async def iter_search_pages(query):
+    # A query run within PLACES_SEARCH_CACHE_TTL replays its stored pages without touching the API
+    cache = get_places_cache()
+    key = normalize_query(query, type='establishment', language='en')
+    cached_pages = await cache.get('textsearch', key)
+    if cached_pages is not None:
+        logger.info(f"Using {len(cached_pages)} cached result pages for {query}")
+        for page in cached_pages:
+            yield page
+        return
+
+    pages = []
+    search_result = await fetch_places(query)
+    next_page = None
+    try:
+        while True:
+            # The next page is polled for while the caller works through this one
+            page_token = search_result.get('next_page_token')
+            next_page = asyncio.create_task(fetch_next_page(query, page_token)) if page_token else None
+            yield search_result
+            if search_result.get('status') not in ('OK', 'ZERO_RESULTS'):
+                return  # Only complete, successful paginations are cached
+            pages.append({'status': search_result['status'],
+                          'results': [{'place_id': place['place_id']} for place in search_result.get('results', [])]})
+
+            if next_page is None:
+                break
+            search_result = await next_page
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+    await cache.put('textsearch', key, pages)
 
 
-async def fetch_places(query, page_token=None):
+def places_request(query, page_token=None):
+    if page_token:
+        return gmaps.get().places(query=query, page_token=page_token, type='establishment', language='en')
+    return gmaps.get().places(query=query, type='establishment', language='en')
+
+
+async def fetch_places(query):
     try:
-        if page_token:
-            return gmaps.places(query=query, page_token=page_token, type='establishment', language='en')
-        else:
-            return gmaps.places(query=query, type='establishment', language='en')
+        return await asyncio.to_thread(places_request, query)
     except Exception as e:
         logger.error(f"Error during fetching places: {str(e)}")
         return {}
 
 
+async def fetch_next_page(query, page_token):
+    # A next_page_token is rejected with INVALID_REQUEST until Google activates it, usually within
+    # a couple of seconds, so it is retried with a short growing backoff instead of one fixed sleep
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    delay = PAGE_TOKEN_POLL_DELAY
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            search_result = await asyncio.to_thread(places_request, query, page_token)
+            status = search_result.get('status')
+        except googlemaps.exceptions.ApiError as e:
+            search_result, status = {}, e.status
+        except Exception as e:
+            logger.error(f"Error during fetching places: {str(e)}")
+            return {}
+
+        if status != 'INVALID_REQUEST':
+            logger.info(f"Next results page for {query} ready after {loop.time() - started:.1f}s")
+            return search_result
+        if loop.time() - started + delay > PAGE_TOKEN_TIMEOUT:
+            logger.error(f"next_page_token for {query} still invalid after {PAGE_TOKEN_TIMEOUT:.0f}s")
+            return {}
+        delay = min(delay * 1.5, PAGE_TOKEN_POLL_MAX_DELAY)
+
+
+async def fetch_place_details(place_id):
+    cache = get_places_cache()
+    key = f"{place_id}|{','.join(PLACE_DETAILS_FIELDS)}"
+    cached = await cache.get('details', key)
+    if cached is not None:
+        return cached
+
+    # googlemaps is synchronous, so each lookup runs in a worker thread under a shared cap
+    async with place_details_limiter:
+        place_details = await asyncio.to_thread(
+            lambda: gmaps.get().place(place_id=place_id, fields=PLACE_DETAILS_FIELDS))
+    if place_details.get('status') == 'OK':
+        await cache.put('details', key, place_details)
+    return place_details
+
+
+async def process_place(session, place):
+    try:
+        place_details = await fetch_place_details(place['place_id'])
+    except Exception as e:
+        logger.error(f"Error fetching place details for {place.get('place_id')}: {str(e)}")
+        return None
+
+    result = place_details['result']
+    company_name = result.get('name')
+    website = result.get('website', 'No website found')
+    phone = result.get('formatted_phone_number', 'No phone found')
+    address = result.get('formatted_address', 'No address found')
+    reviews_count = result.get('user_ratings_total', 'N/A')
+
+    if website == 'No website found':
+        return None
+    # A lead delivered recently keeps the emails found then; only its website is not scraped again
+    emails = await get_lead_store().known_emails(website, phone)
+    stored = emails is not None
+    if stored:
+        logger.info(f"Using stored emails for known lead {company_name} ({website})")
+    else:
+        # Scraping starts as soon as this place's details arrive
+        emails = await fetch_and_parse_website(session, website)
+    if emails:  # Add sites where emails were found
+        return Lead(company_name, website, emails, phone, address, reviews=reviews_count, sources=('Google Maps',),
+                    stored=stored)
+    return None
+
+
 async def process_search_results(search_result):
     info = []
-    if search_result['status'] == 'OK':
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            for place in search_result['results']:
-                place_id = place['place_id']
-                place_details = gmaps.place(place_id=place_id,
-                                            fields=['name', 'website', 'formatted_phone_number', 'formatted_address',
-                                                    'user_ratings_total'])
-                result = place_details['result']
-                company_name = result.get('name')
-                website = result.get('website', 'No website found')
-                phone = result.get('formatted_phone_number', 'No phone found')
-                address = result.get('formatted_address', 'No address found')
-                reviews_count = result.get('user_ratings_total', 'N/A')
-
-                if website != 'No website found':
-                    task = asyncio.create_task(fetch_and_parse_website(session, website))
-                    tasks.append((company_name, website, phone, address, reviews_count, task))
-
-            await asyncio.gather(*[t[5] for t in tasks])
-
-            for company_name, website, phone, address, reviews_count, task in tasks:
-                emails = await task
-                if emails:  # Add sites where emails were found
-                    info.append((company_name, website, emails, phone, address, reviews_count))
+    if search_result.get('status') == 'OK':
+        session = get_session()
+        results = await asyncio.gather(*[process_place(session, place) for place in search_result['results']])
+        info = [result for result in results if result]
 
     return info
 
 
-async def fetch_and_parse_website(session, url):
+async def read_page(response, url):
+    # Stream the body instead of response.text() so a huge or endless page cannot hold memory
     try:
-        async with session.get(url) as response:
-            html_content = await response.text()
-            emails = parse_html(html_content)
-            return emails
+        decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    extractor = StreamingEmailExtractor()
+    received = 0
+
+    async for chunk in response.content.iter_chunked(WEBSITE_CHUNK_SIZE):
+        received += len(chunk)
+        extractor.feed(decoder.decode(chunk))
+        if received >= WEBSITE_MAX_BYTES:
+            logger.info(f"Stopped reading {url} at the {WEBSITE_MAX_BYTES} byte cap")
+            break
+        if WEBSITE_MAX_EMAILS and len(extractor.emails) >= WEBSITE_MAX_EMAILS:
+            break
+
+    extractor.feed(decoder.decode(b'', final=True))
+    extractor.close()
+    return extractor
+
+
+def rank_contact_links(page_url, links):
+    # Same-site links whose path looks like a contact, imprint or about page, best candidates first
+    domain = normalize_domain(page_url)
+    ranked = {}
+    for link in links:
+        absolute = urljoin(page_url, link.strip())
+        parsed = urlparse(absolute)
+        if parsed.scheme not in ('http', 'https') or normalize_domain(absolute) != domain:
+            continue
+        path = parsed.path.lower()
+        if path.endswith(('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.zip')):
+            continue
+        score = max((weight for keyword, weight in CONTACT_PAGE_KEYWORDS if keyword in path), default=0)
+        if score:
+            ranked[absolute] = max(score, ranked.get(absolute, 0))
+    return sorted(ranked, key=lambda link: (-ranked[link], len(link)))
+
+
+async def fetch_contact_page(session, url):
+    try:
+        async with session.get(url, timeout=website_timeout) as response:
+            if response.status != 200:
+                return []
+            extractor = await read_page(response, url)
+            return extractor.emails
     except Exception as e:
-        logger.error(f"Error fetching or parsing {url}: {str(e)}")
+        logger.error(f"Error fetching contact page {url}: {str(e)}")
         return []
 
 
-def parse_html(html_content):
-    emails = set(re.findall(r"\b[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]{2,}\b", html_content))
-    return filter_emails(emails)
-
-
-def filter_emails(emails):
-    ignore_patterns = [
-        r'sentry\..+',
-        r'wixpress\.com',
-        r'polyfill\.io',
-        r'lodash\.com',
-        r'core-js-bundle\.com',
-        r'react-dom\.com',
-        r'react\.com',
-        r'npm\.js',
-        r'@[a-zA-Z0-9]*[0-9]{5,}@',
-        r'\b[a-zA-Z]+@[0-9]+\.[0-9]+\.[0-9]+\b',
-        r'@\w*\.png',
-        r'@\w*\.jpg',
-        r'@\w*\.jpeg',
-        r'@\w*\.gif',
-        r'\w+-v\d+@3x-\d+x\d+\.png',
-        r'\w+-v\d+@3x-\d+x\d+\.png.webp',
-        r'[a-zA-Z0-9_\-]+@[0-9]+x[0-9]+\.png',
-        r'[a-zA-Z0-9_\-]+@[0-9]+x[0-9]+\.jpeg',
-        r'[a-zA-Z0-9_\-]+@[0-9]+x[0-9]+\.png.webp',
-        r'[a-zA-Z0-9_\-]+@[\d]+x[\d]+\.png',
-        r'[a-zA-Z0-9_\-]+@\d+x\d+\.(png|jpg|jpeg|gif)',
-        r'[a-zA-Z0-9_\-]+-v\d+_?\d*@[0-9]+x[0-9]+\.png',
-        r'[a-zA-Z0-9_\-]+-v\d+_?\d*@[0-9]+x[0-9]+\.png.webp',
-        r'IASC',
-        r'@\w*\.png.webp',
-        r'Mesa-de-trabajo'
-    ]
-    return [email for email in emails if not any(re.search(pattern, email) for pattern in ignore_patterns)]
+async def crawl_contact_pages(session, page_url, links):
+    candidates = rank_contact_links(page_url, links)[:CONTACT_MAX_PAGES]
+    if not candidates:
+        return []
+
+    logger.info(f"No emails on {page_url}, trying {len(candidates)} contact pages")
+    tasks = [asyncio.create_task(fetch_contact_page(session, link)) for link in candidates]
+    emails = []
+    try:
+        for finished in asyncio.as_completed(tasks, timeout=CONTACT_CRAWL_TIMEOUT):
+            emails = await finished
+            if emails:  # Stop as soon as any contact page yields an address
+                break
+    except asyncio.TimeoutError:
+        logger.info(f"Contact crawl budget of {CONTACT_CRAWL_TIMEOUT:.0f}s used up for {page_url}")
+    finally:
+        for task in tasks:
+            task.cancel()
+    return emails
+
+
+async def fetch_and_parse_website(session, url):
+    # Keyed per business page on shared hosts, so one Facebook page never answers for another;
+    # a bare shared host (no page path) identifies no business and is not cached at all
+    key = site_key(url)
+    cache = get_website_cache()
+    try:
+        cached = await cache.get(key) if key else None
+        if cached and cached.is_fresh():
+            logger.info(f"Using cached emails for {key}")
+            return cached.emails
+
+        request_headers = cached.revalidation_headers() if cached else {}
+        async with session.get(url, headers=request_headers, timeout=website_timeout) as response:
+            if response.status == 304 and cached:
+                await cache.revalidated(key)
+                return cached.emails
+            extractor = await read_page(response, url)
+            status, page_url = response.status, str(response.url)
+            etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+        if status != 200:
+            # Error pages, rate limits and bot walls say nothing about the site; try again next search
+            logger.info(f"Got HTTP {status} from {url}, not caching it")
+            return extractor.emails
+
+        emails = extractor.emails
+        if not emails:
+            emails = await crawl_contact_pages(session, page_url, extractor.links)
+        if key:
+            await cache.put(key, emails, etag, last_modified)
+        return emails
+    except Exception as e:
+        logger.error(f"Error fetching or parsing {url}: {str(e)}")
+        return []
@@ -0,0 +1,55 @@
+import logging
+import os
+import aiohttp
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Connection pool settings shared by every scraper and the Telegram upload
+HTTP_LIMIT = int(os.environ.get("HTTP_LIMIT", 100))
+HTTP_LIMIT_PER_HOST = int(os.environ.get("HTTP_LIMIT_PER_HOST", 10))
+HTTP_DNS_CACHE_TTL = int(os.environ.get("HTTP_DNS_CACHE_TTL", 300))
+HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", 30))
+
+_session = None
+
+
+def get_session():
+    """Return the application-wide ClientSession, creating it on first use."""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=HTTP_LIMIT, limit_per_host=HTTP_LIMIT_PER_HOST,
+                                         ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+                                         keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+                                         enable_cleanup_closed=True)
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+def pool_stats():
+    if _session is None or _session.closed:
+        return {'limit': HTTP_LIMIT, 'in_use': 0, 'idle': 0, 'hosts': {}}
+    connector = _session.connector
+    # aiohttp has no public counters, so read the connector's bookkeeping directly
+    acquired_per_host = getattr(connector, '_acquired_per_host', {})
+    idle = getattr(connector, '_conns', {})
+    return {
+        'limit': connector.limit,
+        'in_use': len(getattr(connector, '_acquired', ())),
+        'idle': sum(len(conns) for conns in idle.values()),
+        'hosts': {key.host: len(conns) for key, conns in acquired_per_host.items() if conns},
+    }
+
+
+def log_pool_stats():
+    stats = pool_stats()
+    logger.info(f"HTTP pool: {stats['in_use']}/{stats['limit']} in use, {stats['idle']} idle, "
+                f"busy hosts: {stats['hosts']}")
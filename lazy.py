@@ -0,0 +1,32 @@
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LazyResource:
+    """Builds an expensive client on first use (or when warmed) instead of at import time."""
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    started = time.monotonic()
+                    self._value = self.factory()
+                    logger.info(f"Initialized {self.name} in {time.monotonic() - started:.2f}s")
+        return self._value
+
+    async def warm(self):
+        # Build in a worker thread so the event loop keeps serving updates meanwhile
+        try:
+            await asyncio.to_thread(self.get)
+        except Exception as e:
+            logger.error(f"Failed to warm up {self.name}: {str(e)}")
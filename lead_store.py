@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import time
+from dotenv import load_dotenv
+from entity_resolution import PHONE_KEY_DIGITS
+from leads import Lead
+from sqlite_store import SqliteStore, get_store
+from trustpilot_parsing import clean_phone_number
+from website_cache import shared_host, site_key
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+LEAD_STORE_DB = os.environ.get("LEAD_STORE_DB", "leads.db")
+# Leads delivered within this many seconds are served from the store instead of scraped again; 0 always re-enriches
+LEAD_REVISIT_AFTER = float(os.environ.get("LEAD_REVISIT_AFTER", 30 * 24 * 60 * 60))
+# Fields kept per source, so a known lead can be returned as that source last delivered it
+DETAIL_FIELDS = ('phone', 'location', 'rating', 'reviews', 'verification')
+# Shorter digit strings are extensions or parse noise, not phone numbers
+MIN_PHONE_DIGITS = 7
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leads (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    domain TEXT,
+    phone TEXT,
+    website TEXT,
+    location TEXT,
+    sources TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_leads_domain ON leads (domain);
+CREATE INDEX IF NOT EXISTS idx_leads_phone ON leads (phone);
+CREATE TABLE IF NOT EXISTS lead_emails (
+    email TEXT PRIMARY KEY,
+    lead_id INTEGER NOT NULL REFERENCES leads (id)
+);
+CREATE INDEX IF NOT EXISTS idx_lead_emails_lead ON lead_emails (lead_id);
+"""
+
+
+def lead_keys(website=None, emails=(), phone=None):
+    # The normalized values leads are matched on: site key (domain, or host/path on shared hosts),
+    # lowercased emails, and the last phone digits, as entity resolution compares them, so Google's
+    # national "030 1234567" and TrustPilot's international "49301234567" are the same phone
+    domain = site_key(website) if website else None
+    emails = sorted({email.strip().lower() for email in emails if email and '@' in email})
+    digits = clean_phone_number(phone) if isinstance(phone, str) else None
+    phone = digits[-PHONE_KEY_DIGITS:] if digits and len(digits) >= MIN_PHONE_DIGITS else None
+    return domain or None, emails, phone
+
+
+class LeadStore(SqliteStore):
+    """Companies found by any source, deduplicated on domain, email and phone through SQLite indexes."""
+
+    def __init__(self, path=LEAD_STORE_DB, revisit_after=LEAD_REVISIT_AFTER):
+        super().__init__(path, SCHEMA)
+        self.revisit_after = revisit_after
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(leads)")}
+        if 'details' not in columns:  # Stores created before per-source details were kept
+            self._conn.execute("ALTER TABLE leads ADD COLUMN details TEXT")
+        # Phones stored before they were keyed on their last digits
+        self._conn.execute("UPDATE leads SET phone = substr(phone, length(phone) - ? + 1) WHERE length(phone) > ?",
+                           (PHONE_KEY_DIGITS, PHONE_KEY_DIGITS))
+
+    def _find(self, domain, emails, phone):
+        if domain:
+            row = self._conn.execute("SELECT id, phone FROM leads WHERE domain = ?", (domain,)).fetchone()
+            # A page on a shared host only identifies the lead when the phones don't disagree
+            if row and not (shared_host(domain.split('/', 1)[0]) and phone and row[1] and row[1] != phone):
+                return row[0]
+        if emails:
+            row = self._conn.execute(
+                f"SELECT lead_id FROM lead_emails WHERE email IN ({','.join('?' * len(emails))})",
+                emails).fetchone()
+            if row:
+                return row[0]
+        if phone:
+            row = self._conn.execute("SELECT id FROM leads WHERE phone = ?", (phone,)).fetchone()
+            if row:
+                return row[0]
+        return None
+
+    def _upsert(self, source, leads):
+        now = time.time()
+        inserted = 0
+        with self._conn:
+            self._conn.execute("BEGIN")
+            for lead in leads:
+                name, website, location = lead.name, lead.website, lead.location
+                domain, emails, phone = lead_keys(website, lead.emails, lead.phone)
+                details = {field: getattr(lead, field) for field in DETAIL_FIELDS if getattr(lead, field) is not None}
+                lead_id = self._find(domain, emails, phone)
+                if lead_id is None:
+                    lead_id = self._conn.execute(
+                        "INSERT INTO leads (name, domain, phone, website, location, sources, first_seen, last_seen, "
+                        "details) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (name, domain, phone, website, location, source, now, now,
+                         json.dumps({source: details}))).lastrowid
+                    inserted += 1
+                else:
+                    stored, = self._conn.execute("SELECT details FROM leads WHERE id = ?", (lead_id,)).fetchone()
+                    stored = json.loads(stored) if stored else {}
+                    stored[source] = details
+                    # Keep what is already known and fill in whatever this source adds
+                    self._conn.execute(
+                        "UPDATE leads SET name = COALESCE(name, ?), domain = COALESCE(domain, ?), "
+                        "phone = COALESCE(phone, ?), website = COALESCE(website, ?), "
+                        "location = COALESCE(location, ?), last_seen = ?, details = ?, "
+                        "sources = CASE WHEN instr(',' || sources || ',', ',' || ? || ',') "
+                        "THEN sources ELSE sources || ',' || ? END WHERE id = ?",
+                        (name, domain, phone, website, location, now, json.dumps(stored), source, source, lead_id))
+                self._conn.executemany("INSERT OR IGNORE INTO lead_emails VALUES (?, ?)",
+                                       [(email, lead_id) for email in emails])
+        return inserted
+
+    def _emails(self, lead_id):
+        rows = self._conn.execute("SELECT email FROM lead_emails WHERE lead_id = ? ORDER BY rowid", (lead_id,))
+        return [email for email, in rows]
+
+    def _known_leads(self, source, domains, since):
+        domains = list(domains)
+        known = {}
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(domains), 500):
+            batch = domains[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT id, name, domain, website, details FROM leads "
+                f"WHERE last_seen >= ? AND domain IN ({','.join('?' * len(batch))})",
+                [since, *batch])
+            for lead_id, name, domain, website, details in rows:
+                # Only what this source itself delivered can stand in for scraping it again
+                details = json.loads(details).get(source) if details else None
+                if details is not None:
+                    known[domain] = Lead(name, website, self._emails(lead_id), sources=(source,), stored=True,
+                                         **details)
+        return known
+
+    def _known_emails(self, domain, phone, since):
+        lead_id = self._find(domain, [], phone)
+        if lead_id is None:
+            return None
+        row = self._conn.execute("SELECT last_seen FROM leads WHERE id = ?", (lead_id,)).fetchone()
+        return self._emails(lead_id) if row[0] >= since else None
+
+    async def upsert(self, source, leads):
+        """Store Lead records source delivered to a user; returns how many were new."""
+        if not leads:
+            return 0
+        inserted = await self._run(self._upsert, source, leads)
+        logger.info(f"Lead store: {inserted} new and {len(leads) - inserted} known leads from {source}")
+        return inserted
+
+    async def known_leads(self, source, domains):
+        """Recently delivered leads by domain, rebuilt from what source stored for them."""
+        domains = {domain for domain in domains if domain and not shared_host(domain)}
+        if not self.revisit_after or not domains:
+            return {}
+        return await self._run(self._known_leads, source, domains, time.time() - self.revisit_after)
+
+    async def known_emails(self, website=None, phone=None):
+        """Stored emails of a recently delivered lead, or None if it has to be scraped."""
+        domain, _, phone = lead_keys(website, (), phone)
+        if not self.revisit_after or not (domain or phone):
+            return None
+        return await self._run(self._known_emails, domain, phone, time.time() - self.revisit_after)
+
+
+def get_lead_store():
+    return get_store(LeadStore)
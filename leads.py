@@ -0,0 +1,45 @@
+PLACEHOLDERS = {None, '', 'N/A', 'None', 'No website found', 'No phone found', 'No address found'}
+
+
+def clean(value):
+    return None if value in PLACEHOLDERS else value
+
+
+class Lead:
+    """One company found by any source; missing fields are None and only rendered as 'N/A' on export.
+
+    stored marks a lead served from the lead store instead of scraped again; it is not re-marked as seen.
+    """
+
+    __slots__ = ('name', 'website', 'emails', 'phone', 'location', 'rating', 'reviews', 'verification', 'sources',
+                 'stored')
+
+    FIELDS = ('name', 'website', 'emails', 'phone', 'location', 'rating', 'reviews', 'verification')
+    HEADER = ['Company Name', 'Website', 'Emails/Contact Info', 'Phone', 'Location', 'Rating', 'Reviews', 'Verification']
+
+    def __init__(self, name, website=None, emails=(), phone=None, location=None, rating=None, reviews=None,
+                 verification=None, sources=(), stored=False):
+        self.name = clean(name)
+        self.website = clean(website)
+        if isinstance(emails, str):
+            emails = (emails,)
+        self.emails = tuple(email for email in emails if clean(email))
+        self.phone = clean(phone)
+        self.location = clean(location)
+        self.rating = clean(rating)
+        self.reviews = clean(reviews)
+        self.verification = clean(verification)
+        self.sources = tuple(sources)
+        self.stored = stored
+
+    @property
+    def source(self):
+        return ', '.join(self.sources)
+
+    def row(self):
+        values = [getattr(self, field) for field in self.FIELDS]
+        values[2] = ', '.join(self.emails)
+        return [value if value not in (None, '') else 'N/A' for value in values]
+
+    def __repr__(self):
+        return f"Lead({self.name!r}, {self.website!r}, sources={self.sources!r})"
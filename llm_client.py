@@ -0,0 +1,101 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+import openai
+from dotenv import load_dotenv
+from http_client import get_session
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# OPENAI_API_BASE (read by the openai package itself) can point the client at a local stub server
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", 8))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 4))
+LLM_RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", 1))
+LLM_REQUEST_TIMEOUT = float(os.environ.get("LLM_REQUEST_TIMEOUT", 60))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 60 * 60))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 1024))
+
+RETRYABLE_ERRORS = (openai.error.RateLimitError, openai.error.APIError, openai.error.Timeout,
+                    openai.error.ServiceUnavailableError, openai.error.APIConnectionError)
+
+llm_limiter = asyncio.Semaphore(LLM_CONCURRENCY)
+
+
+class CompletionCache:
+    """Completions keyed by a hash of model, messages and parameters, expired after a TTL."""
+
+    def __init__(self, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model, messages, params):
+        payload = json.dumps({'model': model, 'messages': messages, 'params': params}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, content):
+        self.entries[key] = (time.monotonic() + self.ttl, content)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+completion_cache = CompletionCache()
+_inflight = {}
+
+
+async def _request(model, messages, params):
+    async with llm_limiter:
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            # openai 0.28 reuses this aiohttp session instead of opening one per request
+            openai.aiosession.set(get_session())
+            try:
+                started = time.monotonic()
+                response = await openai.ChatCompletion.acreate(model=model, messages=messages,
+                                                               request_timeout=LLM_REQUEST_TIMEOUT, **params)
+                logger.info(f"{model} completion took {time.monotonic() - started:.2f}s")
+                return response['choices'][0]['message']['content']
+            except RETRYABLE_ERRORS as e:
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                delay = LLM_RETRY_BASE_DELAY * 2 ** attempt
+                logger.warning(f"OpenAI request failed ({e}), retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+
+async def chat_completion(messages, model="gpt-4o-mini", use_cache=True, **params):
+    """Return the content of the first choice; identical requests share the cached or in-flight answer."""
+    if not use_cache:
+        return await _request(model, messages, params)
+
+    key = CompletionCache.make_key(model, messages, params)
+    content = completion_cache.get(key)
+    if content is not None:
+        return content
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_request(model, messages, params))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    content = await asyncio.shield(task)
+    completion_cache.put(key, content)
+    return content
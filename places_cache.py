@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import re
+import time
+from dotenv import load_dotenv
+from sqlite_store import SqliteStore, get_store
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+PLACES_CACHE_DB = os.environ.get("PLACES_CACHE_DB", "places_cache.db")
+# Search rankings drift faster than a business's details do
+PLACES_CACHE_TTLS = {
+    'textsearch': float(os.environ.get("PLACES_SEARCH_CACHE_TTL", 24 * 60 * 60)),
+    'details': float(os.environ.get("PLACE_DETAILS_CACHE_TTL", 7 * 24 * 60 * 60)),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    endpoint TEXT NOT NULL,
+    key TEXT NOT NULL,
+    response TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (endpoint, key)
+);
+CREATE INDEX IF NOT EXISTS idx_responses_fetched_at ON responses (endpoint, fetched_at);
+"""
+
+
+def normalize_query(query, **params):
+    # "Dentists in  Berlin" and "dentists in berlin." are the same search
+    query = re.sub(r'\s+', ' ', str(query).lower()).strip(' "\'.,;')
+    return '|'.join([query] + [f'{name}={value}' for name, value in sorted(params.items())])
+
+
+class PlacesResponseCache(SqliteStore):
+    """Google Places API responses kept in SQLite, with a TTL per endpoint and hit/miss counters."""
+
+    def __init__(self, path=PLACES_CACHE_DB, ttls=PLACES_CACHE_TTLS):
+        super().__init__(path, SCHEMA)
+        self.ttls = ttls
+        self.hits = dict.fromkeys(ttls, 0)
+        self.misses = dict.fromkeys(ttls, 0)
+
+    def _get(self, endpoint, key, since):
+        row = self._conn.execute(
+            "SELECT response FROM responses WHERE endpoint = ? AND key = ? AND fetched_at >= ?",
+            (endpoint, key, since)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, endpoint, key, response, since):
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                               (endpoint, key, json.dumps(response), time.time()))
+            self._conn.execute("DELETE FROM responses WHERE endpoint = ? AND fetched_at < ?", (endpoint, since))
+
+    async def get(self, endpoint, key):
+        response = await self._run(self._get, endpoint, key, time.time() - self.ttls[endpoint])
+        if response is None:
+            self.misses[endpoint] += 1
+        else:
+            self.hits[endpoint] += 1
+        return response
+
+    async def put(self, endpoint, key, response):
+        await self._run(self._put, endpoint, key, response, time.time() - self.ttls[endpoint])
+
+    def stats(self):
+        return {endpoint: {'hits': self.hits[endpoint], 'misses': self.misses[endpoint]} for endpoint in self.ttls}
+
+    def log_stats(self):
+        for endpoint, counts in self.stats().items():
+            total = counts['hits'] + counts['misses']
+            hit_rate = counts['hits'] / total if total else 0.0
+            logger.info(f"Places cache {endpoint}: {counts['hits']} hits, {counts['misses']} misses "
+                        f"({hit_rate:.0%} hit rate)")
+
+
+def get_places_cache():
+    return get_store(PlacesResponseCache)
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dotenv import load_dotenv
+from sqlite_store import SqliteStore, get_store
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Gmail quotas per sender account; Workspace accounts can raise SMTP_PER_DAY to 2000
+SMTP_PER_MINUTE = int(os.environ.get("SMTP_PER_MINUTE", 20))
+SMTP_PER_DAY = int(os.environ.get("SMTP_PER_DAY", 500))
+# Daily consumption is stored in the send-queue database
+SEND_LOG_DB = os.environ.get("SEND_QUEUE_DB", "send_queue.db")
+DAY = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sender_sends (
+    sender_email TEXT NOT NULL,
+    sent_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sender_sends ON sender_sends (sender_email, sent_at);
+"""
+
+
+class TokenBucket:
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class SendLog(SqliteStore):
+    """Send times per sender over the last day, so the daily budget survives restarts."""
+
+    def __init__(self, path=SEND_LOG_DB):
+        super().__init__(path, SCHEMA)
+
+    def _recent(self, sender_email, since):
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM sender_sends WHERE sender_email = ? AND sent_at < ?",
+                               (sender_email, since))
+            rows = self._conn.execute(
+                "SELECT sent_at FROM sender_sends WHERE sender_email = ? ORDER BY sent_at",
+                (sender_email,)).fetchall()
+        return [sent_at for sent_at, in rows]
+
+    def _add(self, sender_email, sent_at):
+        self._conn.execute("INSERT INTO sender_sends VALUES (?, ?)", (sender_email, sent_at))
+
+    def _remove(self, sender_email, sent_at):
+        self._conn.execute(
+            "DELETE FROM sender_sends WHERE rowid IN "
+            "(SELECT rowid FROM sender_sends WHERE sender_email = ? AND sent_at = ? LIMIT 1)",
+            (sender_email, sent_at))
+
+    async def recent(self, sender_email, since):
+        return await self._run(self._recent, sender_email, since)
+
+    async def add(self, sender_email, sent_at):
+        await self._run(self._add, sender_email, sent_at)
+
+    async def remove(self, sender_email, sent_at):
+        await self._run(self._remove, sender_email, sent_at)
+
+
+def get_send_log():
+    return get_store(SendLog)
+
+
+class SenderRateLimiter:
+    """Paces one sender account against both its per-minute and per-day budget."""
+
+    def __init__(self, sender_email, per_minute=SMTP_PER_MINUTE, per_day=SMTP_PER_DAY):
+        self.sender_email = sender_email
+        self.per_day = per_day
+        self.minute = TokenBucket(per_minute, 60)
+        # Send times within the last 24 hours, loaded from the send log on first use
+        self.day = None
+        self._lock = asyncio.Lock()
+
+    def _day_wait_time(self):
+        now = time.time()
+        while self.day and self.day[0] <= now - DAY:
+            self.day.popleft()
+        return 0.0 if len(self.day) < self.per_day else self.day[0] + DAY - now
+
+    async def acquire(self):
+        # The lock keeps waiters in FIFO order, so concurrent campaigns share the budget fairly
+        async with self._lock:
+            if self.day is None:
+                self.day = deque(await get_send_log().recent(self.sender_email, time.time() - DAY))
+            while True:
+                wait = max(self.minute.wait_time(), self._day_wait_time())
+                if wait <= 0:
+                    break
+                if wait > 60:
+                    logger.warning(f"Daily sending budget exhausted, waiting {wait / 60:.0f} min")
+                await asyncio.sleep(wait)
+            self.minute.consume()
+            sent_at = time.time()
+            self.day.append(sent_at)
+            await get_send_log().add(self.sender_email, sent_at)
+
+    async def refund(self):
+        # Gives back the slot of an acquire() that did not end up sending anything
+        async with self._lock:
+            self.minute.tokens = min(self.minute.capacity, self.minute.tokens + 1)
+            if self.day:
+                await get_send_log().remove(self.sender_email, self.day.pop())
+
+
+_limiters = {}
+
+
+def get_rate_limiter(sender_email):
+    limiter = _limiters.get(sender_email.lower())
+    if limiter is None:
+        limiter = SenderRateLimiter(sender_email.lower())
+        _limiters[sender_email.lower()] = limiter
+    return limiter
+
+
+class HostThrottle:
+    """Caps concurrent requests to one host and spaces their start times at a politeness rate."""
+
+    def __init__(self, concurrency, per_second):
+        self.bucket = TokenBucket(1, 1 / per_second)
+        self._slots = asyncio.Semaphore(concurrency)
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self._slots.acquire()
+        try:
+            async with self._lock:
+                wait = self.bucket.wait_time()
+                while wait > 0:
+                    await asyncio.sleep(wait)
+                    wait = self.bucket.wait_time()
+                self.bucket.consume()
+        except BaseException:
+            self._slots.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._slots.release()
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+import os
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Sources allowed to run at once across all /search requests, and how long each may take
+SEARCH_CONCURRENCY = int(os.environ.get("SEARCH_CONCURRENCY", 8))
+SEARCH_SOURCE_TIMEOUT = float(os.environ.get("SEARCH_SOURCE_TIMEOUT", 600))
+
+search_limiter = asyncio.Semaphore(SEARCH_CONCURRENCY)
+
+
+async def run_source(source, query, search_func, timeout):
+    async with search_limiter:
+        logger.info(f"Processing query for {source}: {query}")
+        try:
+            results = await asyncio.wait_for(search_func(query), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"{source} search timed out after {timeout:.0f}s for: {query}")
+            return source, []
+        except Exception as e:
+            logger.error(f"{source} search failed for {query}: {str(e)}")
+            return source, []
+    logger.info(f"Results found by {source} for {query}: {len(results)}")
+    return source, results
+
+
+async def iter_search_results(sources, timeout=SEARCH_SOURCE_TIMEOUT):
+    """Run (source, query, search_func) triples concurrently and yield (source, results) as each one finishes."""
+    tasks = [asyncio.ensure_future(run_source(source, query, search_func, timeout))
+             for source, query, search_func in sources]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,253 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dotenv import load_dotenv
+from email_sender import SMTP_CONCURRENCY, deliver, is_auth_error, is_transient_error
+from rate_limiter import get_rate_limiter
+from sqlite_store import SqliteStore, get_store
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+SEND_QUEUE_DB = os.environ.get("SEND_QUEUE_DB", "send_queue.db")
+MAX_ATTEMPTS = int(os.environ.get("SEND_MAX_ATTEMPTS", 5))
+RETRY_BASE_DELAY = float(os.environ.get("SEND_RETRY_BASE_DELAY", 30))
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+RETRYING = 'retrying'
+# Claimed by a running campaign and being sent right now
+SENDING = 'sending'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    campaign_id TEXT PRIMARY KEY,
+    sender_email TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    campaign_id TEXT NOT NULL,
+    row_num INTEGER NOT NULL,
+    company_name TEXT NOT NULL,
+    recipient_email TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    PRIMARY KEY (campaign_id, row_num)
+);
+CREATE INDEX IF NOT EXISTS idx_messages_state ON messages (campaign_id, state, row_num);
+CREATE TABLE IF NOT EXISTS campaign_chats (
+    campaign_id TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    PRIMARY KEY (campaign_id, chat_id)
+);
+"""
+
+
+def make_campaign_id(sender_email, subject, content, rows):
+    # Same sender, draft and recipient list -> same campaign, so a re-run resumes instead of resending
+    digest = hashlib.sha256()
+    for part in (sender_email, subject, content):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    for company_name, recipient_email in rows:
+        digest.update(f"{company_name}\0{recipient_email}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class SendQueue(SqliteStore):
+    """SQLite-backed outbound queue; every call runs in a worker thread so the dispatcher never waits on disk."""
+
+    def __init__(self, path=SEND_QUEUE_DB):
+        super().__init__(path, SCHEMA)
+        # Claims still held here were left by a process that stopped mid-send
+        self._conn.execute("UPDATE messages SET state = ? WHERE state = ?", (PENDING, SENDING))
+
+    def _enqueue(self, campaign_id, sender_email, subject, content, rows, chat_id):
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT OR IGNORE INTO campaigns VALUES (?, ?, ?, ?, ?)",
+                (campaign_id, sender_email, subject, content, time.time()))
+            if chat_id is not None:
+                self._conn.execute("INSERT OR IGNORE INTO campaign_chats VALUES (?, ?)", (campaign_id, chat_id))
+            added = self._conn.executemany(
+                "INSERT OR IGNORE INTO messages (campaign_id, row_num, company_name, recipient_email) "
+                "VALUES (?, ?, ?, ?)",
+                ((campaign_id, row_num, company_name, recipient_email)
+                 for row_num, (company_name, recipient_email) in enumerate(rows))).rowcount
+            # Running a campaign again is an explicit request to retry what failed last time
+            return added + self._rearm_failed(campaign_id)
+
+    def _claim(self, campaign_id):
+        # Marking the row as sending inside the same transaction keeps two runs from both taking it
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT row_num, company_name, recipient_email, attempts FROM messages "
+                "WHERE campaign_id = ? AND state IN (?, ?) AND next_attempt_at <= ? "
+                "ORDER BY row_num LIMIT 1",
+                (campaign_id, PENDING, RETRYING, time.time())).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE messages SET state = ? WHERE campaign_id = ? AND row_num = ?",
+                                   (SENDING, campaign_id, row[0]))
+            return row
+
+    def _next_retry_at(self, campaign_id):
+        row = self._conn.execute(
+            "SELECT MIN(next_attempt_at) FROM messages WHERE campaign_id = ? AND state IN (?, ?)",
+            (campaign_id, PENDING, RETRYING)).fetchone()
+        return row[0]
+
+    def _record(self, campaign_id, outcomes):
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE messages SET state = ?, attempts = ?, next_attempt_at = ?, last_error = ? "
+                "WHERE campaign_id = ? AND row_num = ?",
+                ((state, attempts, next_attempt_at, error, campaign_id, row_num)
+                 for row_num, state, attempts, next_attempt_at, error in outcomes))
+
+    def _progress(self, campaign_id):
+        rows = self._conn.execute(
+            "SELECT state, COUNT(*) FROM messages WHERE campaign_id = ? GROUP BY state",
+            (campaign_id,)).fetchall()
+        progress = {PENDING: 0, SENT: 0, FAILED: 0, RETRYING: 0, SENDING: 0}
+        progress.update(dict(rows))
+        return progress
+
+    def _unfinished(self, chat_id):
+        query = ("SELECT c.campaign_id, c.sender_email, c.subject, COUNT(*) FROM campaigns c "
+                 "JOIN messages m ON m.campaign_id = c.campaign_id ")
+        params = [PENDING, RETRYING, SENDING]
+        if chat_id is not None:
+            query += "JOIN campaign_chats cc ON cc.campaign_id = c.campaign_id AND cc.chat_id = ? "
+            params.insert(0, chat_id)
+        query += "WHERE m.state IN (?, ?, ?) GROUP BY c.campaign_id ORDER BY c.created_at"
+        return self._conn.execute(query, params).fetchall()
+
+    def _campaign(self, campaign_id, chat_id):
+        query = "SELECT c.sender_email, c.subject, c.content FROM campaigns c "
+        params = [campaign_id]
+        if chat_id is not None:
+            query += "JOIN campaign_chats cc ON cc.campaign_id = c.campaign_id AND cc.chat_id = ? "
+            params.insert(0, chat_id)
+        return self._conn.execute(query + "WHERE c.campaign_id = ?", params).fetchone()
+
+    def _rearm_failed(self, campaign_id):
+        return self._conn.execute(
+            "UPDATE messages SET state = ?, attempts = 0, next_attempt_at = 0 "
+            "WHERE campaign_id = ? AND state = ?",
+            (PENDING, campaign_id, FAILED)).rowcount
+
+    async def enqueue(self, campaign_id, sender_email, subject, content, rows, chat_id=None):
+        return await self._run(self._enqueue, campaign_id, sender_email, subject, content, rows, chat_id)
+
+    async def campaign(self, campaign_id, chat_id=None):
+        """(sender_email, subject, content) stored for a campaign, or None if that chat has no such campaign."""
+        return await self._run(self._campaign, campaign_id, chat_id)
+
+    async def rearm_failed(self, campaign_id):
+        return await self._run(self._rearm_failed, campaign_id)
+
+    async def claim(self, campaign_id):
+        return await self._run(self._claim, campaign_id)
+
+    async def next_retry_at(self, campaign_id):
+        return await self._run(self._next_retry_at, campaign_id)
+
+    async def record(self, campaign_id, outcomes):
+        await self._run(self._record, campaign_id, outcomes)
+
+    async def progress(self, campaign_id):
+        return await self._run(self._progress, campaign_id)
+
+    async def unfinished_campaigns(self, chat_id=None):
+        """(campaign_id, sender_email, subject, rows left) per campaign with unsent rows, oldest first."""
+        return await self._run(self._unfinished, chat_id)
+
+
+def get_send_queue():
+    return get_store(SendQueue)
+
+
+async def run_campaign(campaign_id, sender_email, sender_password, subject, content,
+                       concurrency=SMTP_CONCURRENCY):
+    """Send every pending or retrying row of a campaign in row order and return its final progress."""
+    queue = get_send_queue()
+    rate_limiter = get_rate_limiter(sender_email)
+    sent = 0
+    auth_errors = []
+    started = time.monotonic()
+
+    async def attempt(row_num, company_name, recipient_email, attempts):
+        # Replace placeholders in the email content
+        personalized_content = content.replace("[Recipient's Company]", company_name)
+        if auth_errors:  # The login was already rejected; leave the row for a run with the right password
+            return row_num, PENDING, attempts, 0, auth_errors[0]
+        try:
+            await deliver(sender_email, sender_password, recipient_email, subject, personalized_content,
+                          pace=False)
+            return row_num, SENT, attempts + 1, 0, None
+        except Exception as e:
+            if is_auth_error(e):
+                logger.error(f"SMTP login rejected for {sender_email}, stopping campaign {campaign_id}: {e}")
+                auth_errors.append(str(e))
+                return row_num, PENDING, attempts, 0, str(e)
+            attempts += 1
+            if is_transient_error(e) and attempts < MAX_ATTEMPTS:
+                delay = RETRY_BASE_DELAY * 2 ** (attempts - 1)
+                logger.warning(f"Transient failure for {recipient_email}, retry {attempts} in {delay:.0f}s: {e}")
+                return row_num, RETRYING, attempts, time.time() + delay, str(e)
+            logger.error(f"Giving up on {recipient_email} after {attempts} attempt(s): {e}")
+            return row_num, FAILED, attempts, 0, str(e)
+
+    async def release(row):
+        # Hand the claim back so the row is sent by the next run
+        row_num, _, _, attempts = row
+        await asyncio.shield(queue.record(campaign_id, [(row_num, PENDING, attempts, 0, None)]))
+
+    async def worker():
+        nonlocal sent
+        while not auth_errors:
+            # The send slot is taken before a row is claimed, so a claim never waits on the budget
+            await rate_limiter.acquire()
+            claim = asyncio.ensure_future(queue.claim(campaign_id))
+            try:
+                row = await asyncio.shield(claim)
+                if row is not None:
+                    outcome = await attempt(*row)
+            except asyncio.CancelledError:
+                row = await claim
+                if row is not None:
+                    await release(row)
+                raise
+
+            if row is None:
+                await rate_limiter.refund()
+                next_retry_at = None if auth_errors else await queue.next_retry_at(campaign_id)
+                if next_retry_at is None:
+                    return
+                await asyncio.sleep(max(0.0, next_retry_at - time.time()))
+                continue
+
+            # Recorded one by one, so a crash resends at most the messages in flight
+            await asyncio.shield(queue.record(campaign_id, [outcome]))
+            if outcome[1] == SENT:
+                sent += 1
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    elapsed = time.monotonic() - started
+    progress = await queue.progress(campaign_id)
+    progress['rate'] = sent / elapsed if elapsed > 0 else 0.0
+    progress['auth_error'] = auth_errors[0] if auth_errors else None
+    logger.info(f"Campaign {campaign_id} finished: {progress[SENT]} sent, {progress[FAILED]} failed, "
+                f"{sent} delivered this run at {progress['rate']:.2f} msg/s")
+    return progress
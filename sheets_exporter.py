@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from dotenv import load_dotenv
+from lazy import LazyResource
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Настройки для Google Sheets
+SERVICE_ACCOUNT_FILE = os.environ.get("SERVICE_ACCOUNT_FILE")
+SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets',
+    'https://www.googleapis.com/auth/drive',
+    'https://www.googleapis.com/auth/drive.file'
+]
+# Point these at a fake Sheets/Drive server in tests
+SHEETS_API_ENDPOINT = os.environ.get("SHEETS_API_ENDPOINT")
+DRIVE_API_ENDPOINT = os.environ.get("DRIVE_API_ENDPOINT")
+
+# One long-lived workbook; its id comes from the env or is remembered in SHEETS_WORKBOOK_FILE
+SHEETS_SPREADSHEET_ID = os.environ.get("SHEETS_SPREADSHEET_ID")
+SHEETS_WORKBOOK_FILE = os.environ.get("SHEETS_WORKBOOK_FILE", "sheets_workbook.txt")
+SHEETS_SHARE_WITH = os.environ.get("SHEETS_SHARE_WITH", "Ivangul999@gmail.com")
+# 'day' gives one tab per date, 'user' one tab per Telegram chat
+SHEETS_TAB_PER = os.environ.get("SHEETS_TAB_PER", "day")
+SHEETS_APPEND_CHUNK = int(os.environ.get("SHEETS_APPEND_CHUNK", 5000))
+
+
+def build_google_service(service_name, version, api_endpoint=None):
+    # googleapiclient is slow to import and build, so both happen on first use
+    from google.auth.credentials import AnonymousCredentials
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
+    if api_endpoint:
+        # A fake endpoint needs no service account
+        credentials = AnonymousCredentials()
+    else:
+        credentials = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+    client_options = {'api_endpoint': api_endpoint} if api_endpoint else None
+    return build(service_name, version, credentials=credentials, client_options=client_options)
+
+
+sheets_service = LazyResource('Google Sheets client',
+                              lambda: build_google_service('sheets', 'v4', SHEETS_API_ENDPOINT))
+drive_service = LazyResource('Google Drive client',
+                             lambda: build_google_service('drive', 'v3', DRIVE_API_ENDPOINT))
+
+
+class SheetsExporter:
+    """Appends search results to tabs of a single reused workbook; all API calls run in a worker thread."""
+
+    def __init__(self, header):
+        self.header = header
+        self.spreadsheet_id = SHEETS_SPREADSHEET_ID
+        self.tabs = None
+        self._lock = asyncio.Lock()
+
+    def _ensure_workbook(self):
+        if self.spreadsheet_id:
+            return
+        if os.path.exists(SHEETS_WORKBOOK_FILE):
+            with open(SHEETS_WORKBOOK_FILE, encoding='utf-8') as f:
+                self.spreadsheet_id = f.read().strip()
+            if self.spreadsheet_id:
+                return
+
+        spreadsheet = {'properties': {'title': 'Search Results'}}
+        spreadsheet = sheets_service.get().spreadsheets().create(body=spreadsheet, fields='spreadsheetId').execute()
+        self.spreadsheet_id = spreadsheet.get('spreadsheetId')
+        self.tabs = set()
+        logging.info(f'New Spreadsheet created. ID: {self.spreadsheet_id}')
+
+        # Granting access
+        permission = {
+            'type': 'user',
+            'role': 'writer',
+            'emailAddress': SHEETS_SHARE_WITH
+        }
+        drive_service.get().permissions().create(fileId=self.spreadsheet_id, body=permission).execute()
+        logging.info(f'Access granted to {SHEETS_SHARE_WITH}')
+
+        with open(SHEETS_WORKBOOK_FILE, 'w', encoding='utf-8') as f:
+            f.write(self.spreadsheet_id)
+
+    def _ensure_tab(self, title):
+        if self.tabs is None:
+            spreadsheet = sheets_service.get().spreadsheets().get(
+                spreadsheetId=self.spreadsheet_id, fields='sheets.properties.title').execute()
+            self.tabs = {sheet['properties']['title'] for sheet in spreadsheet.get('sheets', [])}
+        if title in self.tabs:
+            return False
+
+        body = {'requests': [{"addSheet": {"properties": {"title": title}}}]}
+        sheets_service.get().spreadsheets().batchUpdate(spreadsheetId=self.spreadsheet_id, body=body).execute()
+        self.tabs.add(title)
+        logging.info(f"Added new sheet: {title}")
+        return True
+
+    def _export(self, rows, title):
+        self._ensure_workbook()
+        if self._ensure_tab(title):
+            rows = [self.header] + rows
+
+        updated = 0
+        for start in range(0, len(rows), SHEETS_APPEND_CHUNK):
+            result = sheets_service.get().spreadsheets().values().append(
+                spreadsheetId=self.spreadsheet_id, range=f"'{title}'!A1",
+                valueInputOption='RAW', insertDataOption='INSERT_ROWS',
+                body={'values': rows[start:start + SHEETS_APPEND_CHUNK]}).execute()
+            updated += result.get('updates', {}).get('updatedCells', 0)
+        logging.info(f"{updated} cells appended to {title}.")
+        return self.spreadsheet_id
+
+    def tab_title(self, chat_id=None):
+        if SHEETS_TAB_PER == 'user' and chat_id is not None:
+            return f'User {chat_id}'
+        return f'Results {datetime.now().strftime("%Y-%m-%d")}'
+
+    async def export(self, rows, chat_id=None):
+        # The lock keeps concurrent searches from creating the same workbook or tab twice
+        async with self._lock:
+            return await asyncio.to_thread(self._export, rows, self.tab_title(chat_id))
@@ -0,0 +1,41 @@
+import asyncio
+import sqlite3
+import threading
+
+
+class SqliteStore:
+    """One SQLite connection in WAL mode, used from worker threads one call at a time so the event loop never waits on disk."""
+
+    def __init__(self, path, schema):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(schema)
+        self._lock = threading.Lock()
+
+    def _run(self, func, *args):
+        def locked():
+            with self._lock:
+                return func(*args)
+        return asyncio.to_thread(locked)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_stores = {}
+
+
+def get_store(store_class):
+    # One shared instance per store class, opened on first use
+    store = _stores.get(store_class)
+    if store is None:
+        store = _stores[store_class] = store_class()
+    return store
+
+
+def close_stores():
+    for store in _stores.values():
+        store.close()
+    _stores.clear()
@@ -0,0 +1,243 @@
+"""The pooled SMTP engine and the campaign dispatcher, run with aiosmtplib against a local SMTP stand-in.
+
+Usage: python -m unittest discover tests   (from the repository root)
+"""
+import asyncio
+import base64
+import os
+import socket
+import tempfile
+import unittest
+from email import message_from_string
+from email.header import decode_header, make_header
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# The engine reads its settings at import time, so they point at the stand-in before it is imported
+_tmp = tempfile.TemporaryDirectory()
+os.environ.update({
+    'SMTP_SERVER': '127.0.0.1',
+    'SMTP_PORT': str(free_port()),
+    'SMTP_START_TLS': 'false',
+    'SMTP_TIMEOUT': '5',
+    'SMTP_PER_MINUTE': '100000',
+    'SEND_QUEUE_DB': os.path.join(_tmp.name, 'send_queue.db'),
+    'SEND_RETRY_BASE_DELAY': '0',
+})
+
+import email_sender  # noqa: E402
+from send_queue import FAILED, PENDING, RETRYING, SENT, get_send_queue, make_campaign_id, run_campaign  # noqa: E402
+from sqlite_store import close_stores  # noqa: E402
+
+PASSWORD = 'app-password'
+
+
+class SMTPStandIn:
+    """Just enough of an SMTP server for aiosmtplib: EHLO, AUTH PLAIN, MAIL, RCPT, DATA, RSET and QUIT."""
+
+    def __init__(self, port):
+        self.port = port
+        self.connections = 0
+        self.logins = 0
+        self.messages = []
+        # Recipients whose RCPT TO gets a 451 once before they are accepted, and ones always refused
+        self.defer_once = set()
+        self.refuse = set()
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._session, '127.0.0.1', self.port)
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _session(self, reader, writer):
+        self.connections += 1
+
+        async def reply(line):
+            writer.write(line.encode() + b'\r\n')
+            await writer.drain()
+
+        await reply('220 stand-in ESMTP')
+        mail_from, recipients = None, []
+        try:
+            while line := await reader.readline():
+                command, _, argument = line.decode().rstrip('\r\n').partition(' ')
+                command = command.upper()
+                if command == 'EHLO':
+                    await reply('250-stand-in\r\n250-AUTH PLAIN\r\n250 8BITMIME')
+                elif command == 'AUTH':
+                    self.logins += 1
+                    password = base64.b64decode(argument.split(' ')[1]).decode().split('\0')[2]
+                    await reply('235 2.7.0 Accepted' if password == PASSWORD
+                                else '535 5.7.8 Username and Password not accepted')
+                elif command == 'MAIL':
+                    mail_from, recipients = argument[5:].strip('<>'), []
+                    await reply('250 OK')
+                elif command == 'RCPT':
+                    recipient = argument[3:].strip('<>')
+                    if recipient in self.defer_once:
+                        self.defer_once.discard(recipient)
+                        await reply('451 4.3.0 Try again later')
+                        continue
+                    if recipient in self.refuse:
+                        await reply('550 5.1.1 No such user')
+                        continue
+                    recipients.append(recipient)
+                    await reply('250 OK')
+                elif command == 'DATA':
+                    await reply('354 End data with <CR><LF>.<CR><LF>')
+                    data = []
+                    while (chunk := await reader.readline()) not in (b'.\r\n', b''):
+                        data.append(chunk)
+                    self.messages.append((mail_from, recipients, b''.join(data).decode()))
+                    await reply('250 OK queued')
+                elif command == 'QUIT':
+                    await reply('221 Bye')
+                    break
+                else:  # RSET, NOOP
+                    await reply('250 OK')
+        finally:
+            writer.close()
+
+    def recipients(self):
+        return [recipient for _, recipients, _ in self.messages for recipient in recipients]
+
+
+class EmailEngineTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = SMTPStandIn(email_sender.SMTP_PORT)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await email_sender.close_pools()
+        await self.server.stop()
+
+    async def start_campaign(self, sender_email, rows, subject='Hello', content="Hi [Recipient's Company]",
+                             chat_id=None):
+        campaign_id = make_campaign_id(sender_email, subject, content, rows)
+        await get_send_queue().enqueue(campaign_id, sender_email, subject, content, rows, chat_id)
+        return campaign_id
+
+
+class SMTPConnectionPoolTest(EmailEngineTestCase):
+    async def test_connections_are_reused(self):
+        pool = email_sender.SMTPConnectionPool('pool@example.com', PASSWORD, size=2)
+        for i in range(5):
+            await pool.send(email_sender.build_message('pool@example.com', f'to{i}@example.org', 'Hi', 'Body'))
+        await pool.close()
+
+        self.assertEqual(self.server.recipients(), [f'to{i}@example.org' for i in range(5)])
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.logins, 1)
+
+    async def test_refused_recipients_keep_the_connection(self):
+        self.server.defer_once.add('deferred@example.org')
+        self.server.refuse.add('bounced@example.org')
+        pool = email_sender.SMTPConnectionPool('pool@example.com', PASSWORD, size=1)
+        for recipient in ('deferred@example.org', 'bounced@example.org', 'ok@example.org'):
+            msg = email_sender.build_message('pool@example.com', recipient, 'Hi', 'Body')
+            try:
+                await pool.send(msg)
+            except Exception as e:
+                self.assertTrue(email_sender.is_envelope_error(e))
+        await pool.close()
+
+        self.assertEqual(self.server.recipients(), ['ok@example.org'])
+        self.assertEqual((self.server.connections, self.server.logins), (1, 1))
+
+    async def test_rejected_login_is_not_retried(self):
+        pool = email_sender.SMTPConnectionPool('pool@example.com', 'wrong', size=2)
+        msg = email_sender.build_message('pool@example.com', 'to@example.org', 'Hi', 'Body')
+        for _ in range(3):
+            with self.assertRaises(Exception) as raised:
+                await pool.send(msg)
+            self.assertTrue(email_sender.is_auth_error(raised.exception))
+
+        self.assertEqual(self.server.logins, 1)
+        self.assertEqual(self.server.messages, [])
+
+
+class RunCampaignTest(EmailEngineTestCase):
+    async def test_every_row_is_sent_once(self):
+        sender = 'campaign@example.com'
+        rows = [(f'Company {i}', f'lead{i}@example.org') for i in range(20)]
+        campaign_id = await self.start_campaign(sender, rows)
+
+        progress = await run_campaign(campaign_id, sender, PASSWORD, 'Hello', "Hi [Recipient's Company]",
+                                      concurrency=4)
+        self.assertEqual(progress[SENT], 20)
+        self.assertIsNone(progress['auth_error'])
+        self.assertEqual(sorted(self.server.recipients()), sorted(email for _, email in rows))
+        data = next(data for _, recipients, data in self.server.messages if recipients == ['lead7@example.org'])
+        self.assertEqual(message_from_string(data).get_payload(decode=True).decode(), 'Hi Company 7')
+
+        # A re-run of a finished campaign has nothing left to send
+        await self.start_campaign(sender, rows)
+        progress = await run_campaign(campaign_id, sender, PASSWORD, 'Hello', "Hi [Recipient's Company]")
+        self.assertEqual(progress[SENT], 20)
+        self.assertEqual(len(self.server.messages), 20)
+
+    async def test_transient_rejection_is_retried(self):
+        sender = 'retry@example.com'
+        rows = [('Deferred Ltd', 'deferred@example.org'), ('Direct Ltd', 'direct@example.org')]
+        self.server.defer_once.add('deferred@example.org')
+        campaign_id = await self.start_campaign(sender, rows)
+
+        progress = await run_campaign(campaign_id, sender, PASSWORD, 'Hello', "Hi [Recipient's Company]")
+        self.assertEqual((progress[SENT], progress[RETRYING], progress[FAILED]), (2, 0, 0))
+        self.assertEqual(sorted(self.server.recipients()), ['deferred@example.org', 'direct@example.org'])
+
+    async def test_rejected_login_stops_the_campaign(self):
+        sender = 'wrong-password@example.com'
+        rows = [(f'Company {i}', f'lead{i}@example.org') for i in range(10)]
+        campaign_id = await self.start_campaign(sender, rows)
+
+        progress = await run_campaign(campaign_id, sender, 'wrong', 'Hello', "Hi [Recipient's Company]",
+                                      concurrency=4)
+        self.assertIsNotNone(progress['auth_error'])
+        self.assertEqual(progress[PENDING], 10)
+        self.assertEqual(self.server.logins, 1)
+
+        # The same campaign goes out once the password is fixed
+        progress = await run_campaign(campaign_id, sender, PASSWORD, 'Hello', "Hi [Recipient's Company]",
+                                      concurrency=4)
+        self.assertEqual(progress[SENT], 10)
+        self.assertEqual(len(self.server.messages), 10)
+
+    async def test_interrupted_campaign_resumes_from_stored_draft(self):
+        sender = 'resume@example.com'
+        rows = [(f'Company {i}', f'lead{i}@example.org') for i in range(6)]
+        campaign_id = await self.start_campaign(sender, rows, 'Original subject', "Hello [Recipient's Company]",
+                                                chat_id=42)
+        await run_campaign(campaign_id, sender, 'wrong', 'Original subject', "Hello [Recipient's Company]")
+
+        # After a restart only the chat, the campaign id and the password are known
+        queue = get_send_queue()
+        self.assertEqual([(cid, remaining) for cid, _, _, remaining in await queue.unfinished_campaigns(42)],
+                         [(campaign_id, 6)])
+        self.assertEqual(await queue.unfinished_campaigns(7), [])
+        self.assertIsNone(await queue.campaign(campaign_id, 7))
+        sender_email, subject, content = await queue.campaign(campaign_id, 42)
+
+        progress = await run_campaign(campaign_id, sender_email, PASSWORD, subject, content)
+        self.assertEqual(progress[SENT], 6)
+        self.assertEqual(await queue.unfinished_campaigns(42), [])
+        self.assertEqual(sorted(self.server.recipients()), sorted(email for _, email in rows))
+        self.assertEqual({str(make_header(decode_header(message_from_string(data)['Subject'])))
+                          for _, _, data in self.server.messages}, {'Original subject'})
+
+
+def tearDownModule():
+    close_stores()
+    _tmp.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
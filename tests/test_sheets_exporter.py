@@ -0,0 +1,141 @@
+"""SheetsExporter through the real Google API client against a local Sheets/Drive stand-in.
+
+Usage: python -m unittest discover tests   (from the repository root)
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+# The exporter reads its settings at import time, so they point at the stand-in before it is imported
+_tmp = tempfile.TemporaryDirectory()
+_server = ThreadingHTTPServer(('127.0.0.1', 0), BaseHTTPRequestHandler)
+_endpoint = f'http://127.0.0.1:{_server.server_address[1]}'
+os.environ.update({
+    'SERVICE_ACCOUNT_FILE': '',
+    'SHEETS_API_ENDPOINT': _endpoint,
+    'DRIVE_API_ENDPOINT': _endpoint,
+    'SHEETS_SPREADSHEET_ID': '',
+    'SHEETS_WORKBOOK_FILE': os.path.join(_tmp.name, 'sheets_workbook.txt'),
+    'SHEETS_SHARE_WITH': 'owner@example.com',
+    'SHEETS_TAB_PER': 'user',
+    'SHEETS_APPEND_CHUNK': '2',
+})
+
+import sheets_exporter  # noqa: E402
+
+HEADER = ['Company Name', 'Website']
+
+
+class SheetsStandIn:
+    """The five Sheets/Drive calls the exporter makes, answered from in-memory workbooks."""
+
+    def __init__(self):
+        self.workbooks = {}
+        self.permissions = []
+        self.appends = []
+
+    def handle(self, method, path, body):
+        path = unquote(path)
+        if method == 'POST' and path == '/v4/spreadsheets':
+            spreadsheet_id = f'sheet-{len(self.workbooks) + 1}'
+            self.workbooks[spreadsheet_id] = {}
+            return {'spreadsheetId': spreadsheet_id}
+        if match := re.fullmatch(r'/files/([^/]+)/permissions', path):
+            self.permissions.append((match[1], body['emailAddress'], body['role']))
+            return {'id': 'permission-1'}
+        if match := re.fullmatch(r'/v4/spreadsheets/([^/:]+)', path):
+            return {'sheets': [{'properties': {'title': title}} for title in self.workbooks[match[1]]]}
+        if match := re.fullmatch(r'/v4/spreadsheets/([^/:]+):batchUpdate', path):
+            for request in body['requests']:
+                self.workbooks[match[1]][request['addSheet']['properties']['title']] = []
+            return {'replies': [{} for _ in body['requests']]}
+        if match := re.fullmatch(r"/v4/spreadsheets/([^/:]+)/values/'(.+)'!A1:append", path):
+            values = body['values']
+            self.workbooks[match[1]][match[2]].extend(values)
+            self.appends.append(len(values))
+            return {'updates': {'updatedCells': sum(len(row) for row in values)}}
+        raise KeyError(f'{method} {path}')
+
+
+class Handler(BaseHTTPRequestHandler):
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        try:
+            status, payload = 200, self.server.stand_in.handle(self.command, urlparse(self.path).path, body)
+        except KeyError as e:
+            status, payload = 404, {'error': {'code': 404, 'message': str(e)}}
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+def setUpModule():
+    _server.RequestHandlerClass = Handler
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+
+
+def tearDownModule():
+    _server.shutdown()
+    _server.server_close()
+    _tmp.cleanup()
+
+
+class SheetsExporterTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.stand_in = _server.stand_in = SheetsStandIn()
+        if os.path.exists(sheets_exporter.SHEETS_WORKBOOK_FILE):
+            os.remove(sheets_exporter.SHEETS_WORKBOOK_FILE)
+
+    async def test_new_workbook_is_created_shared_and_remembered(self):
+        exporter = sheets_exporter.SheetsExporter(HEADER)
+        spreadsheet_id = await exporter.export([['Bakery', 'bakery.de']], chat_id=42)
+
+        self.assertEqual(spreadsheet_id, 'sheet-1')
+        self.assertEqual(self.stand_in.permissions, [('sheet-1', 'owner@example.com', 'writer')])
+        self.assertEqual(self.stand_in.workbooks['sheet-1'], {'User 42': [HEADER, ['Bakery', 'bakery.de']]})
+        with open(sheets_exporter.SHEETS_WORKBOOK_FILE, encoding='utf-8') as f:
+            self.assertEqual(f.read(), 'sheet-1')
+
+        # A restarted bot keeps appending to the same workbook
+        self.assertEqual(await sheets_exporter.SheetsExporter(HEADER).export([['Garage', 'garage.com']], 42), 'sheet-1')
+        self.assertEqual(len(self.stand_in.workbooks), 1)
+
+    async def test_existing_tab_gets_no_second_header(self):
+        self.stand_in.workbooks['sheet-7'] = {'User 42': [HEADER, ['Bakery', 'bakery.de']]}
+        exporter = sheets_exporter.SheetsExporter(HEADER)
+        exporter.spreadsheet_id = 'sheet-7'
+        await exporter.export([['Garage', 'garage.com']], chat_id=42)
+        await exporter.export([['Florist', 'florist.com']], chat_id=7)
+
+        self.assertEqual(self.stand_in.workbooks['sheet-7'], {
+            'User 42': [HEADER, ['Bakery', 'bakery.de'], ['Garage', 'garage.com']],
+            'User 7': [HEADER, ['Florist', 'florist.com']],
+        })
+        self.assertEqual(self.stand_in.permissions, [])
+
+    async def test_rows_are_appended_in_chunks(self):
+        exporter = sheets_exporter.SheetsExporter(HEADER)
+        rows = [[f'Company {i}', f'company{i}.com'] for i in range(4)]
+        await exporter.export(rows, chat_id=42)
+
+        # Header plus four rows at SHEETS_APPEND_CHUNK=2 rows per call
+        self.assertEqual(self.stand_in.appends, [2, 2, 1])
+        self.assertEqual(self.stand_in.workbooks['sheet-1']['User 42'], [HEADER] + rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "tiny")
+TRANSCRIBE_WORKERS = int(os.environ.get("TRANSCRIBE_WORKERS", 1))
+# Clips up to TRANSCRIBE_SHORT_CLIP seconds that arrive within the window go to a worker together
+TRANSCRIBE_BATCH_SIZE = int(os.environ.get("TRANSCRIBE_BATCH_SIZE", 4))
+TRANSCRIBE_BATCH_WINDOW = float(os.environ.get("TRANSCRIBE_BATCH_WINDOW", 0.25))
+TRANSCRIBE_SHORT_CLIP = float(os.environ.get("TRANSCRIBE_SHORT_CLIP", 20))
+
+# Set in each worker process by _load_model
+_model = None
+
+
+def _load_model(model_size):
+    global _model
+    import whisper
+    _model = whisper.load_model(model_size)
+
+
+def _decode_audio(audio_bytes):
+    # Decode straight from memory with ffmpeg (as whisper.load_audio does for files): 16 kHz mono float32
+    import numpy as np
+    pcm = subprocess.run(
+        ["ffmpeg", "-nostdin", "-threads", "0", "-i", "pipe:0", "-f", "s16le", "-ac", "1",
+         "-acodec", "pcm_s16le", "-ar", "16000", "pipe:1"],
+        input=audio_bytes, capture_output=True, check=True).stdout
+    return np.frombuffer(pcm, np.int16).flatten().astype(np.float32) / 32768.0
+
+
+def _transcribe_batch(clips):
+    results = []
+    for audio_bytes in clips:
+        try:
+            results.append((_model.transcribe(_decode_audio(audio_bytes))['text'], None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+
+class TranscriptionService:
+    """Whisper transcription in worker processes; callers await a future per voice message."""
+
+    def __init__(self, model_size=WHISPER_MODEL, workers=TRANSCRIBE_WORKERS):
+        self.model_size = model_size
+        self.workers = workers
+        self.in_flight = 0
+        self._pool = None
+        self._queue = None
+        self._dispatcher = None
+
+    def queue_depth(self):
+        return (self._queue.qsize() if self._queue else 0) + self.in_flight
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_load_model, initargs=(self.model_size,))
+
+    def _replace_broken_pool(self, broken):
+        # A failed model load or an OOM-killed worker breaks the whole pool; later clips get a fresh one
+        if self._pool is broken:
+            logger.error("Transcription worker pool is broken, starting a new one")
+            self._pool = self._new_pool()
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def _ensure_started(self):
+        # Workers and the Whisper model are only loaded once the first voice message arrives
+        if self._pool is None:
+            self._pool = self._new_pool()
+            self._queue = asyncio.Queue()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def transcribe(self, audio_bytes, duration=None):
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((audio_bytes, duration, future))
+        logger.info(f"Voice clip queued for transcription, queue depth {self.queue_depth()}")
+        return await future
+
+    @staticmethod
+    def _is_short(item):
+        duration = item[1]
+        return duration is None or duration <= TRANSCRIBE_SHORT_CLIP
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            batch = [item]
+            if self._is_short(item):
+                deadline = loop.time() + TRANSCRIBE_BATCH_WINDOW
+                while len(batch) < TRANSCRIBE_BATCH_SIZE:
+                    try:
+                        next_item = await asyncio.wait_for(self._queue.get(), deadline - loop.time())
+                    except asyncio.TimeoutError:
+                        break
+                    if self._is_short(next_item):
+                        batch.append(next_item)
+                    else:
+                        self._submit([next_item])
+            self._submit(batch)
+
+    def _submit(self, batch):
+        pool = self._pool
+        try:
+            result = asyncio.get_running_loop().run_in_executor(pool, _transcribe_batch,
+                                                                [audio_bytes for audio_bytes, _, _ in batch])
+        except Exception as e:
+            # Raised right away once the pool is broken; fail this batch instead of the dispatcher
+            self._fail(batch, e)
+            if isinstance(e, BrokenProcessPool):
+                self._replace_broken_pool(pool)
+            return
+        self.in_flight += len(batch)
+        result.add_done_callback(lambda done: self._resolve(batch, done, pool))
+
+    @staticmethod
+    def _fail(batch, error):
+        for _, _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def _resolve(self, batch, done, pool):
+        self.in_flight -= len(batch)
+        futures = [future for _, _, future in batch]
+        error = asyncio.CancelledError() if done.cancelled() else done.exception()
+        if isinstance(error, BrokenProcessPool):
+            self._replace_broken_pool(pool)
+        if error is not None:
+            self._fail(batch, error)
+            return
+        for future, (text, error) in zip(futures, done.result()):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(f"Transcription failed: {error}"))
+            else:
+                future.set_result(text)
+
+    def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+transcription_service = TranscriptionService()
@@ -1,15 +1,22 @@
 import asyncio
 import csv
+import importlib.util
 import json
 import logging
-import random
-import re
-from urllib.parse import urljoin
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from urllib.parse import urljoin, urlparse
 import aiofiles
-import aiohttp
-import openai
-from bs4 import BeautifulSoup
-from fuzzywuzzy import process
+from fuzzywuzzy import fuzz, process, utils
+from http_client import get_session
+from lead_store import get_lead_store
+from leads import Lead
+from llm_client import chat_completion
+from rate_limiter import HostThrottle
+from trustpilot_parsing import parse_categories_page, parse_company_page, parse_listing_page
+from website_cache import normalize_domain
 
 
 logger = logging.getLogger(__name__)
@@ -25,10 +32,33 @@ headers = {
 
 base_url = "https://www.trustpilot.com"
 
+# Category list cache; /categories is only re-scraped once the local copy is older than this
+CATEGORIES_FILE = 'categories.csv'
+CATEGORY_CACHE_TTL = float(os.environ.get("CATEGORY_CACHE_TTL", 24 * 60 * 60))
+# First wait after a failed category refresh; it doubles on each further failure, up to the TTL
+CATEGORY_RETRY_DELAY = float(os.environ.get("CATEGORY_RETRY_DELAY", 5 * 60))
+
+# Politeness settings for trustpilot.com: parallel requests and request starts per second
+TRUSTPILOT_CONCURRENCY = int(os.environ.get("TRUSTPILOT_CONCURRENCY", 4))
+TRUSTPILOT_RATE = float(os.environ.get("TRUSTPILOT_RATE", 2))
+trustpilot_throttle = HostThrottle(TRUSTPILOT_CONCURRENCY, TRUSTPILOT_RATE)
+# Parsing runs in worker processes; TRUSTPILOT_PARSER=lxml is faster if lxml is installed, and
+# TRUSTPILOT_PARSE_ONLY=true builds only the tags the extractors look at
+TRUSTPILOT_PARSE_WORKERS = int(os.environ.get("TRUSTPILOT_PARSE_WORKERS", 2))
+TRUSTPILOT_PARSER = os.environ.get("TRUSTPILOT_PARSER", "html.parser")
+TRUSTPILOT_PARSE_ONLY = os.environ.get("TRUSTPILOT_PARSE_ONLY", "false").lower() == "true"
+if TRUSTPILOT_PARSER == 'lxml' and importlib.util.find_spec('lxml') is None:
+    logger.warning("TRUSTPILOT_PARSER=lxml but lxml is not installed, falling back to html.parser")
+    TRUSTPILOT_PARSER = 'html.parser'
+_parse_pool = None
+
+# Listing pages fetched ahead of the page currently being enriched
+TRUSTPILOT_PREFETCH_PAGES = int(os.environ.get("TRUSTPILOT_PREFETCH_PAGES", 2))
+
 
 async def gpt_parse_query(prompt):
     try:
-        response = openai.ChatCompletion.create(
+        content = await chat_completion(
             model="gpt-4o-mini",
             messages=[
                 {
@@ -46,8 +76,7 @@ async def gpt_parse_query(prompt):
             ],
         )
 
-        content = response.choices[0]['message']['content'].strip()
-        return content
+        return content.strip()
 
     except Exception as e:
         logger.error(f"GPT parsing error: {str(e)}")
@@ -73,194 +102,258 @@ async def build_trustpilot_url(category_link, country=None, city=None, rating=No
     return url
 
 
-# Function for parsing categories and writing to CSV
-async def get_category_link(category_name):
-    await parse_and_save_categories()
-
-    with open('categories.csv', mode='r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        categories = list(reader)
+class CategoryIndex:
+    """In-memory index over categories.csv, refreshed from TrustPilot only when older than the TTL."""
+
+    def __init__(self, path=CATEGORIES_FILE, ttl=CATEGORY_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.rows = []
+        self.substrings = {}
+        self.fuzzy_choices = {}
+        self.loaded_at = 0.0
+        self.retry_at = 0.0
+        self.retry_delay = CATEGORY_RETRY_DELAY
+        self._refresh_lock = asyncio.Lock()
+        if os.path.exists(path):
+            with open(path, mode='r', encoding='utf-8') as file:
+                self.build([(row['Category'], row['Link']) for row in csv.DictReader(file)])
+            self.loaded_at = os.path.getmtime(path)
+
+    def build(self, category_data):
+        self.rows = list(category_data)
+        # Every substring of every lowercased name maps to the rows containing it, so the
+        # original "word in category" partial match becomes one dict lookup per keyword
+        substrings = {}
+        for idx, (name, _) in enumerate(self.rows):
+            category = name.lower()
+            for start in range(len(category)):
+                for end in range(start + 1, len(category) + 1):
+                    substrings.setdefault(category[start:end], set()).add(idx)
+        self.substrings = substrings
+        # Names are normalised once here instead of on every extractOne call
+        self.fuzzy_choices = {idx: utils.full_process(name, force_ascii=True) for idx, (name, _) in enumerate(self.rows)}
+        self.loaded_at = time.time()
+
+    def is_stale(self):
+        return not self.rows or time.time() - self.loaded_at > self.ttl
+
+    async def refresh_if_stale(self):
+        async with self._refresh_lock:
+            if not self.is_stale() or time.time() < self.retry_at:
+                return
+            try:
+                category_data = await parse_and_save_categories(self.path)
+            except Exception as e:
+                logger.error(f"Failed to refresh TrustPilot categories: {str(e)}")
+                category_data = None
+            if category_data:
+                self.build(category_data)
+                self.retry_delay = CATEGORY_RETRY_DELAY
+                return
+            # Keep serving the stale index and leave /categories alone for a while
+            logger.warning(f"Using {len(self.rows)} cached categories, next refresh attempt in {self.retry_delay:.0f}s")
+            self.retry_at = time.time() + self.retry_delay
+            self.retry_delay = min(self.retry_delay * 2, self.ttl)
+
+    def lookup(self, category_name):
+        # Extract keywords from the query
+        key_words = set(str(category_name).lower().split())
+
+        scores = {}
+        for word in key_words:
+            for idx in self.substrings.get(word, ()):
+                scores[idx] = scores.get(idx, 0) + 1
+        if scores:
+            # Highest score wins; ties go to the earliest row, as in the original linear scan
+            best_idx = min(scores, key=lambda idx: (-scores[idx], idx))
+            return self.rows[best_idx]
 
-    logger.info(f"Category name: {category_name}")
-    # Extract keywords from the query
-    key_words = set(str(category_name).lower().split())
-
-    best_match = None
-    best_score = 0
-
-    for row in categories:
-        category = row['Category'].lower()
-        # Check for partial matches
-        if any(word in category for word in key_words):
-            score = len([word for word in key_words if word in category])
-            if score > best_score:
-                best_score = score
-                best_match = row
-
-    if not best_match:
         # If no partial match, use fuzzy matching
-        category_names = [row['Category'] for row in categories]
-        best_match_name = process.extractOne(category_name, category_names)
+        query = utils.full_process(str(category_name), force_ascii=True)
+        best_match_name = process.extractOne(query, self.fuzzy_choices, processor=None,
+                                             scorer=partial(fuzz.WRatio, full_process=False))
         if best_match_name and best_match_name[1] > 60:  # 60% similarity threshold
-            best_match = next(row for row in categories if row['Category'] == best_match_name[0])
+            return self.rows[best_match_name[2]]
+        return None
+
+
+category_index = CategoryIndex()
+
+
+async def get_category_link(category_name):
+    await category_index.refresh_if_stale()
+
+    logger.info(f"Category name: {category_name}")
+    best_match = category_index.lookup(category_name)
 
     if best_match:
-        logging.info(f"Found category link for: {category_name} -> {best_match['Category']}")
-        return best_match['Link']
+        logging.info(f"Found category link for: {category_name} -> {best_match[0]}")
+        return best_match[1]
 
     logging.warning(f"Category not found: {category_name}")
     return None
 
 
-async def parse_and_save_categories():
-    response = await aiohttp.ClientSession().get(base_url + "/categories", headers=headers)
-    if response.status != 200:
-        logging.error(f"Failed to retrieve page: {base_url}/categories")
-        return
-
-    soup = BeautifulSoup(await response.text(), 'html.parser')
-    categories = soup.find_all('a', class_='link_notUnderlined__szqki')
+# Function for parsing categories and writing to CSV
+async def parse_and_save_categories(path=CATEGORIES_FILE):
+    async with get_session().get(base_url + "/categories", headers=headers) as response:
+        if response.status != 200:
+            logging.error(f"Failed to retrieve page: {base_url}/categories")
+            return None
+        html = await response.text()
 
-    category_data = [(category.get_text(), category['href']) for category in categories]
+    category_data = await run_parser(parse_categories_page, html)
 
-    async with aiofiles.open('categories.csv', mode='w', newline='', encoding='utf-8') as file:
+    async with aiofiles.open(path, mode='w', newline='', encoding='utf-8') as file:
         writer = csv.writer(file)
         await writer.writerow(['Category', 'Link'])
         for name, link in category_data:
             await writer.writerow([name, link])
 
     logging.info(f"Saved all categories")
+    return category_data
 
 
-async def random_delay():
-    await asyncio.sleep(random.uniform(1, 5))
+def get_parse_pool():
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=TRUSTPILOT_PARSE_WORKERS)
+    return _parse_pool
 
 
-async def parse_companies_and_contacts(session, category_link, min_reviews=None, max_reviews=None):
-    company_data = []
-    seen_companies = set()
+def shutdown_parse_pool():
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(cancel_futures=True)
+        _parse_pool = None
 
-    if min_reviews is None:
-        min_reviews = 0
-    if max_reviews is None:
-        max_reviews = 999999
 
-    page_num = 1
-    while True:
-        paged_url = urljoin(base_url, category_link) + f"&page={page_num}"
-        async with session.get(paged_url, headers=headers) as response:
-            await random_delay()
+async def run_parser(parse_func, html):
+    # BeautifulSoup is pure Python and slow on large pages, so parsing runs outside the event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_parse_pool(), parse_func, html, TRUSTPILOT_PARSER, TRUSTPILOT_PARSE_ONLY)
+
+
+async def fetch_page(session, url):
+    async with trustpilot_throttle:
+        async with session.get(url, headers=headers) as response:
             if response.status != 200:
+                return response.status, None
+            return response.status, await response.text()
+
+
+async def prefetch_listing_pages(session, category_link, pages):
+    # Producer: keeps up to pages.maxsize listing pages ready while detail pages are being parsed
+    page_num = 1
+    try:
+        while True:
+            paged_url = urljoin(base_url, category_link) + f"&page={page_num}"
+            status, html = await fetch_page(session, paged_url)
+            if status != 200:
                 logger.error(f"Failed to retrieve category page: {paged_url}")
                 break  # Exit the loop on error
 
             logger.info(f"Successfully retrieved category page: {paged_url}")
-            soup = BeautifulSoup(await response.text(), 'html.parser')
-
-            # Check for the results count
-            results_count_element = soup.find('p', class_='typography_body-m__xgxZ_')
-            if results_count_element:
-                results_count = int(re.search(r'\d+', results_count_element.get_text()).group())
-                if results_count == 0:
-                    logger.info("No more results to process.")
-                    break  # Exit the loop if there are no results
-
-            companies = soup.find_all('a', attrs={'name': 'business-unit-card'})
-            logger.info(f"Found {len(companies)} companies on page {page_num}")
-
-            if not companies:  # If no companies found, exit the loop
-                logger.info("No more companies found on this page.")
+            listing = await run_parser(parse_listing_page, html)
+            if not listing:  # Results count is 0 or the page has no company cards
                 break
 
-            for company in companies:
-                company_name = re.sub(r'\.com|\.ai', '',
-                                      company.find('p', class_='typography_heading-xs__jSwUz').get_text()
-                                      .replace('.com', '').strip()).strip().capitalize()
-                company_link = company['href']
-
-                if company_name not in seen_companies:
-                    logger.info(f"Parsing company: {company_name}")
-                    company_details = await parse_company_details(session, company_link)
-
-                    if company_details:
-                        rating, email, phone_number, location, verification_status, website, reviews = company_details
-
-                        # Convert reviews to integer and filter based on the provided range
-                        try:
-                            reviews_count = int(reviews)
-                        except ValueError:
-                            logger.warning(f"Invalid review count for {company_name}: {reviews}")
-                            reviews_count = 0
-
-                        logger.info(f"{min_reviews} <= {reviews_count} <= {max_reviews}")
-                        if min_reviews <= reviews_count <= max_reviews:
-                            company_data.append((company_name, rating, email, phone_number, location,
-                                                 verification_status, website, reviews))
-                            seen_companies.add(company_name)
-                            logger.info(f"Added company: {company_name} with {reviews} reviews (in range)")
-                        else:
-                            logger.info(f"Skipped company: {company_name} with {reviews} reviews (out of range)")
-
+            logger.info(f"Found {len(listing)} companies on page {page_num}")
+            await pages.put((page_num, listing))
             page_num += 1  # Increment the page number for the next iteration
+    except Exception as e:
+        logger.error(f"Error retrieving category pages for {category_link}: {str(e)}")
+    # Not reached on cancellation: the consumer has stopped, and a put on a full queue would block forever
+    await pages.put(None)
 
-    logger.info(f"Total unique companies parsed: {len(company_data)}")
-    return company_data
-
-
-async def parse_company_details(session, company_link):
-    async with session.get(base_url + company_link, headers=headers) as response:
-        await random_delay()
-        if response.status != 200:
-            logger.error(f"Failed to retrieve company page: {base_url + company_link}")
-            return None
 
-        logger.info(f"Successfully retrieved company page: {base_url + company_link}")
-        soup = BeautifulSoup(await response.text(), 'html.parser')
+async def parse_companies_and_contacts(session, category_link, min_reviews=None, max_reviews=None):
+    company_data = []
+    seen_companies = set()
 
-        # Парсинг email
-        email_tag = soup.find('a', href=lambda href: href and "mailto:" in href)
-        email = email_tag['href'].replace("mailto:", "") if email_tag else None
+    if min_reviews is None:
+        min_reviews = 0
+    if max_reviews is None:
+        max_reviews = 999999
 
-        # Парсинг рейтинга
-        rating_tag = soup.find('p', class_='typography_body-l__KUYFJ typography_appearance-subtle__8_H2l', attrs={'data-rating-typography': 'true'})
-        rating = rating_tag.get_text().strip() if rating_tag else None
+    pages = asyncio.Queue(maxsize=TRUSTPILOT_PREFETCH_PAGES)
+    producer = asyncio.create_task(prefetch_listing_pages(session, category_link, pages))
+    try:
+        while True:
+            page = await pages.get()
+            if page is None:
+                break
+            page_num, listing = page
 
-        # Парсинг телефона
-        phone_tag = soup.find('a', href=lambda href: href and "tel:" in href)
-        phone_number = clean_phone_number(phone_tag.get_text().strip()) if phone_tag else None
+            new_companies = []
+            for company_name, company_link in listing:
+                if company_name not in seen_companies:
+                    seen_companies.add(company_name)
+                    new_companies.append((company_name, company_link))
+
+            # Companies delivered recently come from the lead store instead of their detail pages
+            known = await get_lead_store().known_leads('TrustPilot', (review_domain(link) for _, link in new_companies))
+            if known:
+                logger.info(f"Using {len(known)} stored companies on page {page_num}")
+                for company_name, company_link in new_companies:
+                    lead = known.get(review_domain(company_link))
+                    if lead is not None and in_review_range(lead.reviews, min_reviews, max_reviews):
+                        company_data.append(lead)
+                new_companies = [(name, link) for name, link in new_companies if review_domain(link) not in known]
+
+            # Detail pages of this listing page are fetched in parallel, paced by trustpilot_throttle
+            logger.info(f"Parsing {len(new_companies)} companies from page {page_num}")
+            details = await asyncio.gather(*[parse_company_details(session, link) for _, link in new_companies])
+
+            for (company_name, _), company_details in zip(new_companies, details):
+                if company_details:
+                    rating, email, phone_number, location, verification_status, website, reviews = company_details
+
+                    if in_review_range(reviews, min_reviews, max_reviews):
+                        lead = Lead(company_name, website, email or (), phone_number, location, rating, reviews,
+                                    verification_status, sources=('TrustPilot',))
+                        company_data.append(lead)
+                        logger.info(f"Added company: {company_name} with {reviews} reviews (in range)")
+                    else:
+                        logger.info(f"Skipped company: {company_name} with {reviews} reviews (out of range)")
+    finally:
+        producer.cancel()
 
-        # Парсинг локации
-        location_tag = soup.find('ul', class_='styles_contactInfoAddressList__RxiJI')
-        location = ", ".join([loc.get_text().replace(',', '') for loc in location_tag.find_all('li')]) if location_tag else None
+    logger.info(f"Total unique companies parsed: {len(company_data)}")
+    return company_data
 
-        # Статус верификации
-        verification_tag = soup.find('button', class_='styles_verificationLabel__kukuk')
-        verification_status = "True" if verification_tag else "False"
 
-        # Парсинг веб-сайта
-        website_tag = soup.find('a', class_='link_internal__7XN06 link_wrapper__5ZJEx', href=True)
-        website = website_tag['href'] if website_tag else None
+def in_review_range(reviews, min_reviews, max_reviews):
+    # Convert reviews to integer and filter based on the provided range
+    try:
+        reviews_count = int(reviews)
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid review count: {reviews}")
+        reviews_count = 0
 
-        # Парсинг количества отзывов
-        reviews_tag = soup.find('span', class_='typography_body-l__KUYFJ typography_appearance-subtle__8_H2l styles_text__W4hWi')
-        reviews = "0"
+    logger.info(f"{min_reviews} <= {reviews_count} <= {max_reviews}")
+    return min_reviews <= reviews_count <= max_reviews
 
-        if reviews_tag:
-            reviews_text = reviews_tag.get_text()
-            reviews_match = re.search(r'[\d,]+', reviews_text)
-            if reviews_match:
-                reviews = reviews_match.group().replace(',', '')
-            else:
-                logger.warning(f"Unable to extract review count from text: {reviews_text}")
 
-        logger.info(f"Parsed details for company - Rating: {rating}, Email: {email}, Phone: {phone_number}, "
-                    f"Location: {location}, Verification: {verification_status}, Website: {website}, Reviews: {reviews}")
+def review_domain(company_link):
+    # Review pages live at /review/<company domain>
+    path = urlparse(company_link).path.rstrip('/')
+    return normalize_domain(path.rsplit('/', 1)[-1]) if '/review/' in path else None
 
-        return rating, email, phone_number, location, verification_status, website, reviews
 
+async def parse_company_details(session, company_link):
+    try:
+        status, html = await fetch_page(session, base_url + company_link)
+    except Exception as e:
+        logger.error(f"Error retrieving company page {base_url + company_link}: {str(e)}")
+        return None
+    if status != 200:
+        logger.error(f"Failed to retrieve company page: {base_url + company_link}")
+        return None
 
-def clean_phone_number(phone_number):
-    return re.sub(r'\D', '', phone_number)
+    logger.info(f"Successfully retrieved company page: {base_url + company_link}")
+    return await run_parser(parse_company_page, html)
 
 
 async def trustpilot_search(query):
@@ -289,9 +382,7 @@ async def trustpilot_search(query):
         if category_link:
             trustpilot_url = await build_trustpilot_url(category_link, country, city, rating)
 
-            # Ensure proper session management
-            async with aiohttp.ClientSession() as session:
-                return await parse_companies_and_contacts(session, trustpilot_url, min_reviews, max_reviews)
+            return await parse_companies_and_contacts(get_session(), trustpilot_url, min_reviews, max_reviews)
 
         logger.warning(f"Failed to find a matching category for: {category}")
         return []
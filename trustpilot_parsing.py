@@ -0,0 +1,93 @@
+import logging
+import re
+from bs4 import BeautifulSoup, SoupStrainer
+
+# Field extraction for TrustPilot pages. Kept free of asyncio and network imports so the
+# functions can run in worker processes; each takes the BeautifulSoup parser backend to use.
+
+logger = logging.getLogger(__name__)
+
+# With strained=True only these tags (and their children) are built into the tree
+CATEGORY_TAGS = SoupStrainer('a')
+LISTING_TAGS = SoupStrainer(['p', 'a'])
+DETAIL_TAGS = SoupStrainer(['a', 'p', 'ul', 'button', 'span'])
+
+
+def parse_categories_page(html, parser='html.parser', strained=False):
+    soup = BeautifulSoup(html, parser, parse_only=CATEGORY_TAGS if strained else None)
+    categories = soup.find_all('a', class_='link_notUnderlined__szqki')
+    return [(category.get_text(), category['href']) for category in categories]
+
+
+def parse_listing_page(html, parser='html.parser', strained=False):
+    soup = BeautifulSoup(html, parser, parse_only=LISTING_TAGS if strained else None)
+
+    # Check for the results count
+    results_count_element = soup.find('p', class_='typography_body-m__xgxZ_')
+    if results_count_element:
+        results_count = int(re.search(r'\d+', results_count_element.get_text()).group())
+        if results_count == 0:
+            logger.info("No more results to process.")
+            return []
+
+    companies = soup.find_all('a', attrs={'name': 'business-unit-card'})
+    if not companies:
+        logger.info("No more companies found on this page.")
+        return []
+
+    listing = []
+    for company in companies:
+        company_name = re.sub(r'\.com|\.ai', '',
+                              company.find('p', class_='typography_heading-xs__jSwUz').get_text()
+                              .replace('.com', '').strip()).strip().capitalize()
+        listing.append((company_name, company['href']))
+    return listing
+
+
+def parse_company_page(html, parser='html.parser', strained=False):
+    soup = BeautifulSoup(html, parser, parse_only=DETAIL_TAGS if strained else None)
+
+    # Парсинг email
+    email_tag = soup.find('a', href=lambda href: href and "mailto:" in href)
+    email = email_tag['href'].replace("mailto:", "") if email_tag else None
+
+    # Парсинг рейтинга
+    rating_tag = soup.find('p', class_='typography_body-l__KUYFJ typography_appearance-subtle__8_H2l', attrs={'data-rating-typography': 'true'})
+    rating = rating_tag.get_text().strip() if rating_tag else None
+
+    # Парсинг телефона
+    phone_tag = soup.find('a', href=lambda href: href and "tel:" in href)
+    phone_number = clean_phone_number(phone_tag.get_text().strip()) if phone_tag else None
+
+    # Парсинг локации
+    location_tag = soup.find('ul', class_='styles_contactInfoAddressList__RxiJI')
+    location = ", ".join([loc.get_text().replace(',', '') for loc in location_tag.find_all('li')]) if location_tag else None
+
+    # Статус верификации
+    verification_tag = soup.find('button', class_='styles_verificationLabel__kukuk')
+    verification_status = "True" if verification_tag else "False"
+
+    # Парсинг веб-сайта
+    website_tag = soup.find('a', class_='link_internal__7XN06 link_wrapper__5ZJEx', href=True)
+    website = website_tag['href'] if website_tag else None
+
+    # Парсинг количества отзывов
+    reviews_tag = soup.find('span', class_='typography_body-l__KUYFJ typography_appearance-subtle__8_H2l styles_text__W4hWi')
+    reviews = "0"
+
+    if reviews_tag:
+        reviews_text = reviews_tag.get_text()
+        reviews_match = re.search(r'[\d,]+', reviews_text)
+        if reviews_match:
+            reviews = reviews_match.group().replace(',', '')
+        else:
+            logger.warning(f"Unable to extract review count from text: {reviews_text}")
+
+    logger.info(f"Parsed details for company - Rating: {rating}, Email: {email}, Phone: {phone_number}, "
+                f"Location: {location}, Verification: {verification_status}, Website: {website}, Reviews: {reviews}")
+
+    return rating, email, phone_number, location, verification_status, website, reviews
+
+
+def clean_phone_number(phone_number):
+    return re.sub(r'\D', '', phone_number)
@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import time
+from urllib.parse import parse_qs, urlparse
+from dotenv import load_dotenv
+from sqlite_store import SqliteStore, get_store
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+WEBSITE_CACHE_DB = os.environ.get("WEBSITE_CACHE_DB", "website_cache.db")
+WEBSITE_CACHE_TTL = float(os.environ.get("WEBSITE_CACHE_TTL", 7 * 24 * 60 * 60))
+WEBSITE_CACHE_MAX_ENTRIES = int(os.environ.get("WEBSITE_CACHE_MAX_ENTRIES", 50000))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS websites (
+    domain TEXT PRIMARY KEY,
+    emails TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_websites_last_used ON websites (last_used);
+"""
+
+# Social and platform hosts where many unrelated businesses have their page; the path tells them apart
+SHARED_SITE_HOSTS = {
+    'facebook.com', 'fb.com', 'instagram.com', 'twitter.com', 'x.com', 'linkedin.com', 'youtube.com',
+    'tiktok.com', 'pinterest.com', 'vk.com', 't.me', 'wa.me', 'linktr.ee', 'sites.google.com', 'google.com',
+    'g.page', 'goo.gl', 'yelp.com', 'tripadvisor.com', 'booking.com', 'etsy.com', 'ebay.com', 'amazon.com',
+}
+
+
+def normalize_domain(url):
+    if '://' not in url:
+        url = 'http://' + url
+    host = (urlparse(url).hostname or '').lower().rstrip('.')
+    return host[4:] if host.startswith('www.') else host
+
+
+def shared_host(domain):
+    # m.facebook.com, de-de.facebook.com, ... all count as facebook.com
+    matches = [host for host in SHARED_SITE_HOSTS if domain == host or domain.endswith('.' + host)]
+    return max(matches, key=len) if matches else None
+
+
+def site_key(url):
+    """The domain identifying a business's website; host plus path on shared hosts, None if that is empty."""
+    domain = normalize_domain(url)
+    host = shared_host(domain)
+    if host is None:
+        return domain or None
+    parsed = urlparse(url if '://' in url else 'http://' + url)
+    path = parsed.path.strip('/').lower()
+    profile_id = parse_qs(parsed.query).get('id')
+    if profile_id and path.endswith('.php'):  # facebook.com/profile.php?id=...
+        path += '?id=' + profile_id[0]
+    return f'{host}/{path}' if path else None
+
+
+class CachedSite:
+    def __init__(self, emails, etag, last_modified, fetched_at):
+        self.emails = emails
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    def is_fresh(self, ttl=WEBSITE_CACHE_TTL):
+        return time.time() - self.fetched_at < ttl
+
+    def revalidation_headers(self):
+        request_headers = {}
+        if self.etag:
+            request_headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            request_headers['If-Modified-Since'] = self.last_modified
+        return request_headers
+
+
+class WebsiteEmailCache(SqliteStore):
+    """Emails extracted per site (see site_key), kept in SQLite with a TTL and least-recently-used eviction."""
+
+    def __init__(self, path=WEBSITE_CACHE_DB, max_entries=WEBSITE_CACHE_MAX_ENTRIES):
+        super().__init__(path, SCHEMA)
+        self.max_entries = max_entries
+
+    def _get(self, key):
+        row = self._conn.execute(
+            "SELECT emails, etag, last_modified, fetched_at FROM websites WHERE domain = ?",
+            (key,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE websites SET last_used = ? WHERE domain = ?", (time.time(), key))
+        emails, etag, last_modified, fetched_at = row
+        return CachedSite(json.loads(emails), etag, last_modified, fetched_at)
+
+    def _put(self, key, emails, etag, last_modified):
+        now = time.time()
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO websites VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(emails), etag, last_modified, now, now))
+            self._conn.execute(
+                "DELETE FROM websites WHERE domain IN "
+                "(SELECT domain FROM websites ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+
+    def _revalidated(self, key):
+        now = time.time()
+        self._conn.execute("UPDATE websites SET fetched_at = ?, last_used = ? WHERE domain = ?",
+                           (now, now, key))
+
+    async def get(self, key):
+        return await self._run(self._get, key)
+
+    async def put(self, key, emails, etag=None, last_modified=None):
+        await self._run(self._put, key, emails, etag, last_modified)
+
+    async def revalidated(self, key):
+        await self._run(self._revalidated, key)
+
+
+def get_website_cache():
+    return get_store(WebsiteEmailCache)